@@ -24,8 +24,11 @@ from constants2 import BOARD_WIDTH, TEMPLE_INDICES, EMPTY_BOARD, WHITE_TEAM, RED
 from constants2 import W_LOTUS, W_FIRELILY, R_LOTUS, R_FIRELILY
 from constants2 import ORDINAL_DIRECTIONS, DIAGONAL_DIRECTIONS, UP, DOWN, LEFT, RIGHT, UP_L, UP_R, DOWN_L, DOWN_R, WHEEL_DIRECTIONS
 from constants2 import BOARD_COORDS, BOARD_INDICES, PREDEFINED_FIRELILY_SPACES, PREDEFINED_LOTUS_SPACES, PREDEFINED_BADGERMOLE_SPACES
-from constants2 import PIECE_VALUES
+from constants2 import PIECE_VALUES, W_BISONS, R_BISONS, W_WHEEL_1, W_WHEEL_2, R_WHEEL_1, R_WHEEL_2, W_DRAGON, R_DRAGON
 import numpy as np
+import random
+import threading
+from collections import OrderedDict
 
 
 
@@ -45,35 +48,110 @@ so don't be redundant and pass a copy of that board.
 """
 class BoardState:
     __slots__ = ["board", "turnPlayer", "pieceLocations", "emptyIndices", 
-                 "playerCanCapFlowers", "canCapNonFlowers", "bisonTerritories", 
-                 "protectedPieces", "fireLilyRadii", "trappedIndices"]
+                 "playerCanCapFlowers", "canCapNonFlowers", "_bisonCoverage", 
+                 "_protectedPieces", "_fireLilyRadii", "_trappedIndices", "zobristKey",
+                 "undoStack", "pieceMasks", "teamMasks", "occupiedMask", "emptyMask", "pieceIndex", "score"]
     
     def __init__(self, board, turnPlayer, oldState=None):
         self.board = np.copy(board)
         self.turnPlayer = turnPlayer
-        self.updateAll(oldState)
+        self.undoStack = [] #moves made with makeMove, so they can be undone by unmakeMove
+        if oldState:
+            self.shareAll(oldState) #reuse the old state's info instead of recalculating it
+        else:
+            self.updateAll()
     
     
     """
-    recalculates all the info about the board state (do this when a BoardState is created)
+    recalculates all the info about the board state (do this when a BoardState is created from scratch)
     """
-    def updateAll(self, oldState):
-        self.update_pieceLocations(oldState)
+    def updateAll(self):
+        self.update_pieceLocations()
         self.update_emptyIndices()
+        self.update_bitboards()
+        self.update_pieceIndex()
         self.update_playerCanCapFlowers()
         self.update_canCapNonFlowers()
-        self.update_protectedPieces()
-        self.update_fireLilyRadii()
-        self.update_trappedIndices()
-        self.update_bisonTerritories()
+        self.clearLazyFields()
+        self.update_zobristKey()
+        self.update_score()
+    
+    
+    """
+    Copy-on-write: take all the info from an old state (with the same board) instead of recalculating it.
+    - pieceLocations, emptyIndices, the piece bitboard lists and pieceIndex are copied, since performMove edits those in place.
+    - everything else is shared with the old state, not copied. performMove never edits those objects,
+      it replaces them with new ones when a move changes them, so the old state never sees the change.
+    So a child state made by nextState only pays for what its move actually changes, 
+    and unchanged info (bison territories etc.) is stored once for a whole branch of the search tree.
+    """
+    def shareAll(self, oldState):
+        self.pieceLocations = oldState.pieceLocations.copy()
+        self.emptyIndices = oldState.emptyIndices.copy()
+        self.pieceMasks = oldState.pieceMasks.copy()
+        self.teamMasks = oldState.teamMasks.copy()
+        self.pieceIndex = oldState.pieceIndex.copy()
+        self.occupiedMask = oldState.occupiedMask
+        self.emptyMask = oldState.emptyMask
+        self.playerCanCapFlowers = oldState.playerCanCapFlowers
+        self.canCapNonFlowers = oldState.canCapNonFlowers
+        self._protectedPieces = oldState._protectedPieces
+        self._fireLilyRadii = oldState._fireLilyRadii
+        self._trappedIndices = oldState._trappedIndices
+        self._bisonCoverage = oldState._bisonCoverage
+        self.zobristKey = oldState.zobristKey
+        self.score = oldState.score
+    
+    
+    """
+    Lazy fields: protectedPieces, fireLilyRadii, trappedIndices and bisonCoverage are only
+    calculated the first time something asks for them, then cached until a move changes them.
+    (None means "not calculated yet". Lots of states in the search tree never generate moves, 
+    e.g. the eval AI only needs pieceLocations, so they never pay for these.)
+    """
+    def clearLazyFields(self):
+        self._protectedPieces = None
+        self._fireLilyRadii = None
+        self._trappedIndices = None
+        self._bisonCoverage = None
+    
+    @property
+    def protectedPieces(self):
+        if self._protectedPieces is None:
+            self.update_protectedPieces()
+        return self._protectedPieces
+    
+    @property
+    def fireLilyRadii(self):
+        if self._fireLilyRadii is None:
+            self.update_fireLilyRadii()
+        return self._fireLilyRadii
+    
+    @property
+    def trappedIndices(self):
+        if self._trappedIndices is None:
+            self.update_trappedIndices()
+        return self._trappedIndices
+    
+    @property
+    def bisonCoverage(self):
+        if self._bisonCoverage is None:
+            self.update_bisonTerritories()
+        return self._bisonCoverage
+    
+    """bison territory bitboards for each player (spaces covered by at least one of their bison)"""
+    @property
+    def bisonTerritoryMasks(self):
+        return {team: ones | twos for team, (ones, twos) in self.bisonCoverage.items()}
+    
+    """bison territories as sets of indices (not cached - use bisonCoverage for anything that runs a lot)"""
+    @property
+    def bisonTerritories(self):
+        return {team: set(maskToIndices(mask)) for team, mask in self.bisonTerritoryMasks.items()}
     
     """dicts of pieces on board and in pool - so finding them is easier (and only loop over board once)"""
-    def update_pieceLocations(self, oldState):
-        #this is suuuuper expensive. so, just copy the previous state's pieceLocations dict
-        if oldState:
-            self.pieceLocations = oldState.pieceLocations.copy()
-        else:
-            self.pieceLocations = {val:idx for idx, val in enumerate(self.board) if val > 0}
+    def update_pieceLocations(self):
+        self.pieceLocations = {val:idx for idx, val in enumerate(self.board) if val > 0}
     
     """set of empty indices <not temples> (so you only loop over the board once to calculate this)"""
     def update_emptyIndices(self):
@@ -81,6 +159,68 @@ class BoardState:
         self.emptyIndices = BOARD_INDICES - TEMPLE_INDICES - set(self.pieceLocations.values())
         #self.emptyIndices = {idx for idx, val in enumerate(self.board[:WHITE_POOL]) if val == EMPTY and idx not in TEMPLE_INDICES} 
         
+    """
+    bitboards: ints where bit i is set if board index i has that kind of piece on it (board spaces only, not the pools)
+    - pieceMasks: one per team and piece type, indexed by pieceNum//10 (so pieceMasks[13] is white wheels, [25] red chrysanthemums)
+    - teamMasks: all pieces of a team, indexed by team number
+    - occupiedMask: all pieces on board
+    - emptyMask: empty spaces, not including temples (same as emptyIndices)
+    """
+    def update_bitboards(self):
+        self.pieceMasks = [0] * 28
+        self.teamMasks = [0, 0, 0]
+        for pieceNum, idx in self.pieceLocations.items():
+            if idx < WHITE_POOL:
+                self.pieceMasks[pieceNum//10] |= 1 << idx
+                self.teamMasks[pieceNum//100] |= 1 << idx
+        self.occupiedMask = self.teamMasks[WHITE_TEAM] | self.teamMasks[RED_TEAM]
+        self.emptyMask = EMPTY_SPACES_MASK & ~self.occupiedMask
+    
+    """bitboard of all pieces of the given type (both teams)"""
+    def typeMask(self, typ):
+        return self.pieceMasks[10 + typ] | self.pieceMasks[20 + typ]
+    
+    """
+    XORs the moved piece off its start space (unless it's coming from the pool) and onto its destination, 
+    and XORs any captured piece off the destination. 
+    -->XOR is its own inverse, so calling this again with the same move undoes it.
+    """
+    def flipPieceMasks(self, move):
+        destBit = 1 << move.dest_idx
+        moveBits = destBit if move.isPlacement else destBit | (1 << move.start_idx)
+        self.pieceMasks[move.int_piece//10] ^= moveBits
+        self.teamMasks[move.int_piece//100] ^= moveBits
+        if move.dest_val > 0:
+            self.pieceMasks[move.dest_val//10] ^= destBit
+            self.teamMasks[move.dest_val//100] ^= destBit
+    
+    """
+    pieceIndex: dict of (team, piece type, onBoard) -> tuple of the indices where those pieces are
+    (like (WHITE_TEAM, BISON, True) -> indices of white's bisons on the board, (RED_TEAM, WHEEL, False) -> red's wheels in the pool)
+    -->so finding a team's pieces of some type doesn't mean looping over every piece in pieceLocations.
+    Every key is always there (empty tuple if no pieces), and the tuples are never edited, only replaced.
+    """
+    def update_pieceIndex(self):
+        index = {(team, typ, onBoard): [] for team in (WHITE_TEAM, RED_TEAM) for typ in ALL_TYPES for onBoard in (True, False)}
+        for pieceNum, idx in self.pieceLocations.items():
+            index[(pieceNum//100, pieceNum//10%10, idx < WHITE_POOL)].append(idx)
+        self.pieceIndex = {key: tuple(indices) for key, indices in index.items()}
+    
+    """
+    Moves a piece's index in pieceIndex from from_idx to to_idx (either can be None: a captured piece has no to_idx,
+    and unmakeMove puts it back with no from_idx)
+    """
+    def movePieceIndex(self, pieceNum, from_idx, to_idx):
+        team, typ = pieceNum//100, pieceNum//10%10
+        if from_idx is not None:
+            key = (team, typ, from_idx < WHITE_POOL)
+            indices = self.pieceIndex[key]
+            i = indices.index(from_idx)
+            self.pieceIndex[key] = indices[:i] + indices[i+1:]
+        if to_idx is not None:
+            key = (team, typ, to_idx < WHITE_POOL)
+            self.pieceIndex[key] += (to_idx,)
+    
     """dict of players (colors, teams) who can/can't capture flowers (players can cap. flowers if their lotus is on board)"""
     def update_playerCanCapFlowers(self):
         self.playerCanCapFlowers = {WHITE_TEAM: not self.pieceLocations.get(W_LOTUS, -1) >= WHITE_POOL, 
@@ -92,20 +232,63 @@ class BoardState:
     
     """set of all pieces on board that are protected (don't want to calculate this hundreds/thousands of times)"""
     def update_protectedPieces(self):
-        self.protectedPieces = {pieceNum for pieceNum,idx in self.pieceLocations.items() if idx < WHITE_POOL and isProtected(pieceNum, idx, self.board)}
+        self._protectedPieces = {pieceNum for pieceNum,idx in self.pieceLocations.items() if idx < WHITE_POOL and isProtected(pieceNum, idx, self.board)}
+    
+    """
+    updates protectedPieces after a move, by only re-checking the flowers on or next to the move's start and destination.
+    (a flower's protection only changes if it moves, or if a badgermole next to it moves, is placed, or is captured)
+    """
+    def updateProtectedNear(self, move):
+        protected = set(self._protectedPieces) #new set, the old one might be shared with another state
+        protected.discard(move.dest_val)
+        board = self.board
+        nearby = [move.dest_idx]
+        nearby.extend(ADJACENT_INDICES[move.dest_idx])
+        if not move.isPlacement:
+            nearby.extend(ADJACENT_INDICES[move.start_idx])
+        for idx in nearby:
+            pieceNum = int(board[idx])
+            if pieceNum//10%10 in FLOWERS:
+                if isProtected(pieceNum, idx, board):
+                    protected.add(pieceNum)
+                else:
+                    protected.discard(pieceNum)
+        self._protectedPieces = protected
     
     """dict that stores the sets of spaces within 5 of each fire lily"""
     def update_fireLilyRadii(self):
-        self.fireLilyRadii = {WHITE_TEAM: getIndicesWithinN(self.pieceLocations.get(W_FIRELILY, -1), n=5),
+        self._fireLilyRadii = {WHITE_TEAM: getIndicesWithinN(self.pieceLocations.get(W_FIRELILY, -1), n=5),
                               RED_TEAM: getIndicesWithinN(self.pieceLocations.get(R_FIRELILY, -1), n=5)}
     
     """dict of each player's set of all spaces adjacent to an enemy chrysanthemum"""
     def update_trappedIndices(self):
-        self.trappedIndices = {WHITE_TEAM: getTrappedIndices(self, WHITE_TEAM), RED_TEAM: getTrappedIndices(self, RED_TEAM)}
+        self._trappedIndices = {WHITE_TEAM: getTrappedIndices(self, WHITE_TEAM), RED_TEAM: getTrappedIndices(self, RED_TEAM)}
     
-    """dict of bison territories for each player"""
+    """
+    dict of each player's bison coverage: how many of their bison cover each space, as a pair of bitboards (ones, twos).
+    Each team only has 2 bison, so a space's count (0, 1 or 2) fits in those two bits. 
+    -->moving one bison just takes its old radius out and puts its new one in (see addCoverage, removeCoverage),
+       instead of rebuilding the whole territory from every bison.
+    """
     def update_bisonTerritories(self):
-        self.bisonTerritories = {WHITE_TEAM: self.getBisonTerritories(WHITE_TEAM), RED_TEAM: self.getBisonTerritories(RED_TEAM)}
+        coverage = {}
+        for team in (WHITE_TEAM, RED_TEAM):
+            teamCoverage = (0, 0)
+            for idx in self.pieceIndex[(team, BISON, True)]:
+                teamCoverage = addCoverage(teamCoverage, self.bisonRadius(team, idx))
+            coverage[team] = teamCoverage
+        self._bisonCoverage = coverage
+    
+    """
+    running score of the board, from white's perspective (see PIECE_SQUARE_VALUES). evaluation() just scales it.
+    performMove keeps it updated after this with moveScoreDelta, so it never has to loop over the pieces again.
+    """
+    def update_score(self):
+        self.score = sum(PIECE_SQUARE_VALUES[pieceNum][idx] for pieceNum, idx in self.pieceLocations.items())
+    
+    """64-bit Zobrist hash of the board (performMove keeps it updated after this)"""
+    def update_zobristKey(self):
+        self.zobristKey = zobristHash(self.board, self.turnPlayer)
     
     
     
@@ -121,6 +304,12 @@ class BoardState:
         p_typ = move.int_piece // 10 % 10   #type of piece moved
         dest_typ = move.dest_val // 10 % 10 #type of piece at destination
         
+        #before changing anything: if the move changes any bison's territory, remember what those bison covered (for step 8)
+        affectedBison = None
+        if self._bisonCoverage is not None and (p_typ == BISON or dest_typ == BISON or p_typ == CHRYS or dest_typ == CHRYS):
+            affectedBison = self.bisonAffectedBy(move)
+            oldRadii = [self.bisonRadius(pieceNum//100, self.pieceLocations[pieceNum]) for pieceNum in affectedBison]
+        
         #0) update board
         #start space becomes EMPTY, dest space becomes the piece you moved
         self.board[move.start_idx] = EMPTY
@@ -137,6 +326,14 @@ class BoardState:
         self.emptyIndices.discard(move.dest_idx)
         if not move.isPlacement and not move.start_idx in TEMPLE_INDICES: 
             self.emptyIndices.add(move.start_idx)
+        #same thing for the bitboards
+        self.flipPieceMasks(move)
+        self.occupiedMask = self.teamMasks[WHITE_TEAM] | self.teamMasks[RED_TEAM]
+        self.emptyMask = EMPTY_SPACES_MASK & ~self.occupiedMask
+        #and pieceIndex
+        if move.dest_val > 0:
+            self.movePieceIndex(move.dest_val, move.dest_idx, None)
+        self.movePieceIndex(move.int_piece, move.start_idx, move.dest_idx)
         
         #3,4) update playerCanCapFlowers and canCapNonFlowers
         #only recalculate these if the move is a lotus placement
@@ -146,32 +343,98 @@ class BoardState:
             
         #5) update protectedPieces
         #Recalculate every move -->well... only flowers can be protected, and they stay still...
-        #recalculate if: any flower placed, moved, or captured; OR any badgermole placed, moved, or captured
+        #update if: any flower placed, moved, or captured; OR any badgermole placed, moved, or captured
+        #(and only re-check the flowers next to the move - see updateProtectedNear)
         if (p_typ == LOTUS or p_typ == CHRYS or p_typ == FIRELILY or dest_typ == LOTUS or dest_typ == CHRYS or dest_typ == FIRELILY or p_typ == BADGER or dest_typ == BADGER):
-            self.update_protectedPieces()
+            if self._protectedPieces is not None:
+                self.updateProtectedNear(move)
         
         #6) self.fireLilyRadii
-        #only recalculate this when a fire lily is placed or captured.
+        #only invalidate this when a fire lily is placed or captured.
         if (p_typ == FIRELILY) or (dest_typ == FIRELILY):
-            self.update_fireLilyRadii()
+            self._fireLilyRadii = None
         
         #7) self.trappedIndices
-        #only recalculate this if move places a chrysanthemum or captures one. (shortcut: all chrys moves are placement moves)
+        #only invalidate this if move places a chrysanthemum or captures one. (shortcut: all chrys moves are placement moves)
         if (p_typ == CHRYS) or (dest_typ == CHRYS):
-            self.update_trappedIndices()
+            self._trappedIndices = None
         
-        #8) self.bisonTerritories
-        #only recalculate this when a bison is moved or captured, or a chrys is placed or captured
-        if (p_typ == BISON) or (dest_typ == BISON) or (p_typ == CHRYS) or (dest_typ == CHRYS):
-            self.update_bisonTerritories()
+        #8) self.bisonCoverage
+        #only changes when a bison is moved or captured, or a chrys is placed or captured (which can trap/untrap bison)
+        #-->take out the affected bisons' old radii and put in their new ones (if it's been calculated yet)
+        if affectedBison:
+            coverage = dict(self._bisonCoverage) #new dict, the old one might be shared with another state
+            for pieceNum, oldRadius in zip(affectedBison, oldRadii):
+                team = pieceNum//100
+                newRadius = self.bisonRadius(team, self.pieceLocations.get(pieceNum, WHITE_POOL))
+                if newRadius != oldRadius:
+                    coverage[team] = addCoverage(removeCoverage(coverage[team], oldRadius), newRadius)
+            self._bisonCoverage = coverage
+        
+        #9) update zobristKey
+        #XOR out the piece at its start space (and any captured piece), XOR in the piece at its destination, and flip the turn player
+        pieceKeys = ZOBRIST_KEYS[move.int_piece]
+        self.zobristKey ^= pieceKeys[move.start_idx] ^ pieceKeys[move.dest_idx] ^ ZOBRIST_RED_TO_MOVE
+        if move.dest_val > 0:
+            self.zobristKey ^= ZOBRIST_KEYS[move.dest_val][move.dest_idx]
+        
+        #10) update score
+        self.score += moveScoreDelta(move)
         
         #switch players
         self.turnPlayer = 1 + self.turnPlayer%2
         
     
     
+    """
+    Same as performMove, but remembers what it changed so unmakeMove can undo it.
+    -->use for monteCarlo playouts: make moves on one BoardState and then unmake 
+       them all at the end, instead of copying a whole new BoardState every move.
+    
+    Only stores the minimum: the move itself (which knows the captured piece), whether 
+    the destination was in emptyIndices, and the derived fields that performMove replaces. 
+    (performMove always makes new objects for those instead of editing them, so the old ones are still valid.)
+    """
+    def makeMove(self, move):
+        self.undoStack.append( (move, move.dest_idx in self.emptyIndices, self.playerCanCapFlowers, self.canCapNonFlowers, self._protectedPieces, 
+                                self._fireLilyRadii, self._trappedIndices, self._bisonCoverage, self.zobristKey, 
+                                self.occupiedMask, self.emptyMask, self.score) )
+        self.performMove(move)
+    
+    
+    """
+    Undoes the last move made with makeMove (also switches back to the previous player).
+    """
+    def unmakeMove(self):
+        (move, destWasEmpty, self.playerCanCapFlowers, self.canCapNonFlowers, self._protectedPieces, 
+         self._fireLilyRadii, self._trappedIndices, self._bisonCoverage, self.zobristKey, 
+         self.occupiedMask, self.emptyMask, self.score) = self.undoStack.pop()
+        
+        #put the moved piece back on its start space, and the captured piece (or EMPTY) back on the destination
+        self.board[move.start_idx] = move.int_piece
+        self.board[move.dest_idx] = move.dest_val
+        self.pieceLocations[move.int_piece] = move.start_idx
+        if move.dest_val > 0:
+            self.pieceLocations[move.dest_val] = move.dest_idx
+        
+        #undo the changes performMove made to emptyIndices
+        if not move.isPlacement and not move.start_idx in TEMPLE_INDICES: 
+            self.emptyIndices.discard(move.start_idx)
+        if destWasEmpty:
+            self.emptyIndices.add(move.dest_idx)
+        self.flipPieceMasks(move)
+        self.movePieceIndex(move.int_piece, move.dest_idx, move.start_idx)
+        if move.dest_val > 0:
+            self.movePieceIndex(move.dest_val, None, move.dest_idx)
+        
+        #switch players back
+        self.turnPlayer = 1 + self.turnPlayer%2
+    
+    
+    
     """
     Performs the given move on a new BoardState object and returns the new state
+    (the new state shares everything the move doesn't change with this one - see shareAll)
     """
     def nextState(self, move):
         newBoardState = BoardState(self.board, self.turnPlayer, oldState=self)  #make new game state object
@@ -185,13 +448,47 @@ class BoardState:
     """
     def minimize(self):
         return (self.pieceLocations, self.turnPlayer)
+    
+    """
+    returns the board state packed into 45 bytes, so it's cheap to send to another process:
+    the turn player, then the location of every piece (in ALL_PIECES order) as 16-bit ints (-1 if captured).
+    (turn it back into a BoardState with boardStateFromBytes)
+    """
+    def toBytes(self):
+        locations = [self.pieceLocations.get(pieceNum, -1) for pieceNum in ALL_PIECES]
+        return bytes([self.turnPlayer]) + np.array(locations, dtype=np.int16).tobytes()
 
     """
-    encoodes the board state as a unique string
+    encodes the board state (and turn player) as a 64-bit int
+    -->this is the Zobrist key, which performMove keeps updated, so there's nothing to calculate here.
     """
     def hashThis(self):
-        return "".join([str(i) for i in self.board])
-        #TODO: maybe look into "Zobrist Hashing": https://en.wikipedia.org/wiki/Zobrist_hashing
+        return self.zobristKey
+
+    """
+    returns (canonical key, transform): the smallest zobrist key out of this position's 8 symmetric versions
+    (see SYMMETRIES), and the transform that turns this position into that version.
+    Mirror-image positions get the same canonical key, so a table keyed on it stores them only once.
+    -->a move stored for the canonical version is transformMove(move, SYMMETRY_INVERSES[transform]) in this one.
+    """
+    def canonicalKey(self):
+        keys = [self.zobristKey] * 8
+        #only pieces on the board move, so start from this version's key and swap each piece's key for its moved one
+        for pieceNum, idx in self.pieceLocations.items():
+            if idx < WHITE_POOL:
+                pieceKeys = ZOBRIST_KEYS[pieceNum]
+                for t in range(1, 8):
+                    keys[t] ^= pieceKeys[idx] ^ pieceKeys[SYMMETRIES[t][idx]]
+        bestT = min(range(8), key=keys.__getitem__)
+        return keys[bestT], bestT
+
+    """
+    returns a new BoardState of this position turned around by transform t (see SYMMETRIES)
+    """
+    def transformed(self, t):
+        board = self.board.copy()
+        board[SYMMETRIES[t]] = self.board
+        return BoardState(board, self.turnPlayer)
 
 
     """
@@ -221,7 +518,7 @@ class BoardState:
     @param player is the perspective
     """
     def evaluation(self):
-        return sum( (PIECE_VALUES[p] for p in self.pieceLocations) ) /100 #normalize to b/w -1 and 1, since all the piece values happen to add to 100
+        return self.score / 100 #normalize to b/w -1 and 1, since all the piece values happen to add to 100
             
 
 
@@ -229,26 +526,110 @@ class BoardState:
     """
     returns a set of spaces controlled by a given team's sky bison
     @param teamnum is 1 for white and 2 for red.
-    @return set of tuples (row_int,col_int)
+    @return set of board indices
     """
     def getBisonTerritories(self, teamNum):
-        territory = set()
-        for idx in pieceIndicesOnBoard(self, {teamNum}, {BISON}):
-            #if bison on board and not in a temple and not trapped, calc its territory
-            if idx not in TEMPLE_INDICES and idx not in self.trappedIndices[teamNum]:
-                territory |= getIndicesWithinN(idx, n=6) #add all spaces within 6 steps
-                territory.add(idx) #(remember to include bison's own space too)
+        return set(maskToIndices(self.getBisonTerritoryMask(teamNum)))
+    
+    """
+    bitboard version of getBisonTerritories: all spaces within 6 of the team's bison (including the bison's own space)
+    """
+    def getBisonTerritoryMask(self, teamNum):
+        territory = 0
+        for idx in self.pieceIndex[(teamNum, BISON, True)]:
+            territory |= self.bisonRadius(teamNum, idx)
         return territory
     
+    """
+    bitboard of the territory one bison at idx controls: all spaces within 6 (including its own space),
+    or nothing if it's in the pool, on a temple, or trapped.
+    """
+    def bisonRadius(self, teamNum, idx):
+        if idx >= WHITE_POOL or idx in TEMPLE_INDICES or (self.trappedMask(teamNum) >> idx) & 1:
+            return 0
+        return WITHIN_6_MASKS[idx]
+    
+    """
+    returns the bison (pieceNums) whose territory the given move could change:
+    the moved or captured bison, and any bison next to a chrysanthemum that's placed or captured (they get trapped/untrapped)
+    """
+    def bisonAffectedBy(self, move):
+        affected = []
+        for pieceNum in (move.int_piece, move.dest_val):
+            typ = pieceNum // 10 % 10
+            if typ == BISON:
+                affected.append(pieceNum)
+            elif typ == CHRYS and pieceNum > 0:
+                enemyPlayer = 1 + (pieceNum//100)%2
+                for idx in self.pieceIndex[(enemyPlayer, BISON, True)]:
+                    bisonNum = int(self.board[idx])
+                    if (ADJACENT_MASKS[move.dest_idx] >> idx) & 1 and bisonNum not in affected:
+                        affected.append(bisonNum)
+        return affected
+    
     
     
     """
     returns a move that wins the game (captures lotus), if there is one.
-    Note: this is expensive, so don't run this repeatedly in a loop.
+    (cheap: see lotusAttackers)
     """
     def winningMove(self):
-        allMoves = self.getAllMoves_Limited()
-        return next( (m for m in allMoves if m.dest_val == W_LOTUS or m.dest_val == R_LOTUS), None )
+        if self.winner() != -1: return None
+        lotusCaptures = self.lotusAttackers()
+        return lotusCaptures[0] if lotusCaptures else None
+    
+    
+    """
+    returns true if the turn player can capture the enemy lotus this move
+    """
+    def canCaptureLotus(self):
+        return len(self.lotusAttackers()) > 0
+    
+    
+    """
+    Returns a list of the turn player's moves that capture the enemy lotus (usually empty).
+    Instead of generating every move, only checks the pieces that could hit the lotus's space:
+    - the dragon, if the lotus is within 5 of the fire lily
+    - wheels on the same diagonal as the lotus, with only empty spaces in between
+    - bison within 6 spaces of the lotus (only then is it worth walking the bison's moves)
+    """
+    def lotusAttackers(self):
+        player = self.turnPlayer
+        enemyPlayer = 1 + player%2
+        lotusNum = enemyPlayer*100 + LOTUS*10
+        lotus_idx = self.pieceLocations.get(lotusNum, WHITE_POOL)
+        
+        #lotus has to be on board, and capturable (your lotus is on board, and the enemy lotus isn't protected)
+        if lotus_idx >= WHITE_POOL or not self.playerCanCapFlowers[player] or lotusNum in self.protectedPieces:
+            return []
+        
+        attackers = []
+        lotus_row, lotus_col = lotus_idx//BOARD_WIDTH, lotus_idx%BOARD_WIDTH
+        for pieceNum in CAPTURING_PIECES[player]:
+            idx = self.pieceLocations.get(pieceNum, WHITE_POOL)
+            if idx >= WHITE_POOL: 
+                continue
+            typ = pieceNum // 10 % 10
+            
+            #dragon: can capture anything within 5 of its lily
+            if typ == DRAGON:
+                if lotus_idx in self.fireLilyRadii[player]:
+                    attackers.append(getMove(pieceNum, idx, lotus_idx, lotusNum, isCapture=True))
+            
+            #wheel: lotus has to be on one of its diagonals, with nothing in the way
+            elif typ == WHEEL:
+                rows, cols = lotus_row - idx//BOARD_WIDTH, lotus_col - idx%BOARD_WIDTH
+                if rows != 0 and abs(rows) == abs(cols):
+                    step = (rows//abs(rows))*BOARD_WIDTH + cols//abs(cols)
+                    if all(i in self.emptyIndices for i in range(idx + step, lotus_idx, step)):
+                        attackers.append(getMove(pieceNum, idx, lotus_idx, lotusNum, isCapture=True))
+            
+            #bison: can only capture things next to a space it can reach, so the lotus must be within 6
+            elif (WITHIN_6_MASKS[idx] >> lotus_idx) & 1:
+                moveMask, captureMask = skyBisonReach(self, player, idx)
+                if (captureMask >> lotus_idx) & 1:
+                    attackers.append(getMove(pieceNum, idx, lotus_idx, lotusNum, isCapture=True))
+        return attackers
         
     
     
@@ -295,49 +676,96 @@ class BoardState:
     - does not include duplicate moves
     - limits the placement options to just the most common spaces
     *this reduces the branching factor from like 2000 to ~300
+    -->the same positions come up over and over (makeNode, expand, the start of each playout...), 
+       so the moves are kept in MOVE_CACHE and only calculated the first time (see calcAllMoves_Limited)
     """
     def getAllMoves_Limited(self):
+        moves = MOVE_CACHE.get(self.zobristKey)
+        if moves is None:
+            moves = tuple(self.calcAllMoves_Limited())
+            MOVE_CACHE.put(self.zobristKey, moves)
+        return list(moves)
+    
+    """
+    Calculates the moves for getAllMoves_Limited (without the cache)
+    """
+    def calcAllMoves_Limited(self):
         if self.winner() != -1: return [] #no moves if game is over
-        #flags - only look at one of each piece in pool (no duplicate placement moves)
-        pool_badgermole = False
-        pool_chrys = False
-        pool_wheel = False
-        pool_bison = False
         
+        #if you can capture the lotus tile, make it the only option.
+        lotusCaptures = self.lotusAttackers()
+        if lotusCaptures:
+            return lotusCaptures[:1]
+        
+        board = self.board
+        pieceIndex = self.pieceIndex
+        player = self.turnPlayer
         allMoves = []
-        #loop over pieces on board: calc moves for each, add them all to a list
-        for pieceNum, idx in self.pieceLocations.items():
-            #if piece belongs to turn player
-            if pieceNum//100 == self.turnPlayer:
-                typ = pieceNum // 10 % 10
-                
-                #only calculate placement moves for one of each piece type in the pool (avoids duplicate moves)
-                if idx >= WHITE_POOL:
-                    if typ == CHRYS:
-                        if pool_chrys: continue
-                        else: pool_chrys = True
-                    elif typ == BADGER:
-                        if pool_badgermole: continue
-                        else: pool_badgermole = True
-                    elif typ == WHEEL:
-                        if pool_wheel: continue
-                        else: pool_wheel = True
-                    elif typ == BISON:
-                        if pool_bison: continue
-                        else: pool_bison = True
+        for typ in ALL_TYPES:
+            moveFctn = MOVE_FUNCTIONS[typ]
+            #calc moves for each of the turn player's pieces of this type on the board
+            for idx in pieceIndex[(player, typ, True)]:
+                allMoves.extend( moveFctn(self, int(board[idx]), idx, placementMovesFctn=placementMoves_Limited) )
+            #only calculate placement moves for one of each piece type in the pool (avoids duplicate moves)
+            poolIndices = pieceIndex[(player, typ, False)]
+            if poolIndices:
+                idx = poolIndices[0]
+                allMoves.extend( moveFctn(self, int(board[idx]), idx, placementMovesFctn=placementMoves_Limited) )
+        
+        return allMoves
     
-                #calculate moves based on piece type
-                allMoves.extend( MOVE_FUNCTIONS[typ](self, pieceNum, idx, placementMovesFctn=placementMoves_Limited) )
+    
+    
+    """
+    Returns a list of just the capture moves for the turn player (same captures as getAllMoves_Limited)
+    - only wheels, dragons, and sky bison can capture, so only look at those (if they're on the board)
+    - skips all the placement moves, which are the expensive part of getAllMoves_Limited
+    - if you can capture the lotus tile, it's the only option (like getAllMoves_Limited)
+    """
+    def getCaptureMoves(self):
+        if self.winner() != -1: return [] #no moves if game is over
         
-        #if you can capture the lotus tile, make it the only option.
-        # for m in allMoves:
-        #     if (m.dest_val == W_LOTUS) or (m.dest_val == R_LOTUS): 
-        #         return [m]
-        captureLotus = next( (m for m in allMoves if m.dest_val == W_LOTUS or m.dest_val == R_LOTUS), None )
-        if captureLotus: 
-            return [captureLotus]
+        lotusCaptures = self.lotusAttackers()
+        if lotusCaptures:
+            return lotusCaptures[:1]
         
-        return allMoves
+        captureMoves = []
+        for pieceNum in CAPTURING_PIECES[self.turnPlayer]:
+            idx = self.pieceLocations.get(pieceNum, WHITE_POOL)
+            if idx < WHITE_POOL:
+                captureMoves.extend( CAPTURE_FUNCTIONS[pieceNum // 10 % 10](self, pieceNum, idx) )
+        return captureMoves
+    
+    
+    
+    """
+    bitboard of every space the given player's pieces could capture on (if they can reach it). Same rules as canCapture:
+    - enemy flowers that aren't protected, once the player's lotus is on board
+    - enemy non-flowers, once both lotuses are on board (canCapture lets empty temples through then too)
+    """
+    def capturableMask(self, player):
+        enemyPlayer = 1 + player%2
+        pieceMasks = self.pieceMasks
+        enemyFlowers = pieceMasks[enemyPlayer*10 + LOTUS] | pieceMasks[enemyPlayer*10 + CHRYS] | pieceMasks[enemyPlayer*10 + FIRELILY]
+        mask = 0
+        if self.playerCanCapFlowers[player]:
+            mask = enemyFlowers
+            for pieceNum in self.protectedPieces:
+                if pieceNum//100 == enemyPlayer:
+                    mask &= ~(1 << self.pieceLocations[pieceNum])
+        if self.canCapNonFlowers:
+            mask |= (self.teamMasks[enemyPlayer] & ~enemyFlowers) | (TEMPLE_MASK & ~self.occupiedMask)
+        return mask
+    
+    """
+    bitboard of every space where the given player's bison would be trapped (adjacent to an enemy chrysanthemum).
+    Same spaces as trappedIndices, but cheap enough to not need caching.
+    """
+    def trappedMask(self, player):
+        mask = 0
+        for chrys_idx in self.pieceIndex[(1 + player%2, CHRYS, True)]:
+            mask |= ADJACENT_MASKS[chrys_idx]
+        return mask
 
 
 
@@ -354,6 +782,22 @@ def startState():
     return BoardState(EMPTY_BOARD, 1)
 
 
+#every piece, in a fixed order (for BoardState.toBytes), and the board with no pieces on it at all (not even in the pools)
+ALL_PIECES = sorted(PIECE_VALUES)
+BLANK_BOARD = np.where(EMPTY_BOARD > 0, EMPTY, EMPTY_BOARD)
+
+"""
+Returns a new BoardState from the bytes made by BoardState.toBytes()
+"""
+def boardStateFromBytes(data):
+    board = BLANK_BOARD.copy()
+    locations = np.frombuffer(data, dtype=np.int16, offset=1)
+    for pieceNum, idx in zip(ALL_PIECES, locations.tolist()):
+        if idx >= 0:
+            board[idx] = pieceNum
+    return BoardState(board, data[0])
+
+
 """
 converts row and col to int index in board's list
 """
@@ -535,23 +979,170 @@ def getIndicesWithinN(idx, n=5):
 
 
 
+"""
+Bitboards: a set of board indices stored as one python int, where bit i is set if index i is in the set.
+Unions and intersections are then just | and &, which is way faster than doing it with sets.
+(python ints can be as big as you want, so all 289 spaces fit in one)
+"""
+def indicesToMask(indices):
+    mask = 0
+    for idx in indices:
+        mask |= 1 << idx
+    return mask
+
+#for every byte position in a mask, and every value of that byte, the indices of its set bits
+#(so maskToIndices can look at 8 bits at a time instead of one at a time)
+MASK_BYTES = (WHITE_POOL + 7) // 8
+BYTE_INDICES = [[tuple(8*byteNum + bit for bit in range(8) if byteVal >> bit & 1) for byteVal in range(256)] for byteNum in range(MASK_BYTES)]
+
+"""
+returns a list of the indices in a bitboard (only works for board spaces, not the pools)
+"""
+def maskToIndices(mask):
+    indices = []
+    for byteNum, byteVal in enumerate(mask.to_bytes(MASK_BYTES, "little")):
+        if byteVal:
+            indices.extend(BYTE_INDICES[byteNum][byteVal])
+    return indices
+
+#bitboard versions of the board spaces and the cached sets above
+BOARD_MASK = indicesToMask(BOARD_INDICES)
+TEMPLE_MASK = indicesToMask(TEMPLE_INDICES)
+EMPTY_SPACES_MASK = BOARD_MASK & ~TEMPLE_MASK #spaces pieces can normally be placed on (not temples)
+ADJACENT_MASKS = {idx: indicesToMask(ADJACENT_INDICES[idx]) for idx in BOARD_INDICES}
+DIAGONAL_MASKS = {idx: indicesToMask(DIAGONAL_INDICES[idx]) for idx in BOARD_INDICES}
+WITHIN_5_MASKS = {idx: indicesToMask(INDICES_WITHIN_5[idx]) for idx in BOARD_INDICES}
+WITHIN_6_MASKS = {idx: indicesToMask(INDICES_WITHIN_6[idx]) for idx in BOARD_INDICES}
+PREDEFINED_BADGERMOLE_MASK = indicesToMask(PREDEFINED_BADGERMOLE_SPACES)
+PREDEFINED_FIRELILY_MASK = indicesToMask(PREDEFINED_FIRELILY_SPACES)
+PREDEFINED_LOTUS_MASK = indicesToMask(PREDEFINED_LOTUS_SPACES)
+LEFT_COLUMN_MASK = indicesToMask(range(0, WHITE_POOL, BOARD_WIDTH))
+RIGHT_COLUMN_MASK = indicesToMask(range(BOARD_WIDTH-1, WHITE_POOL, BOARD_WIDTH))
+
+"""
+Bison coverage counts (see BoardState.update_bisonTerritories): a pair of bitboards (ones, twos) where a space 
+covered by 1 bison has its bit set in ones, and a space covered by 2 bison has its bit set in twos.
+These add/remove one bison's radius bitboard to/from every space at once, like adding 1 with a carry bit.
+"""
+def addCoverage(coverage, radius):
+    ones, twos = coverage
+    return (ones ^ radius, twos | (ones & radius))
+
+def removeCoverage(coverage, radius):
+    ones, twos = coverage
+    return (ones ^ radius, twos & ~(radius & ~ones))
+
+
+
+"""
+returns a bitboard of all the spaces adjacent to any space in the given bitboard (same as ADJACENT_MASKS, but for lots of spaces at once)
+-->shifting by 1 moves every space left/right, and shifting by BOARD_WIDTH moves it up/down. 
+   The column masks stop spaces on the edge from wrapping around to the other side of the next row.
+"""
+def adjacentMask(mask):
+    return ( ((mask << 1) & ~LEFT_COLUMN_MASK) | ((mask >> 1) & ~RIGHT_COLUMN_MASK) 
+            | (mask << BOARD_WIDTH) | (mask >> BOARD_WIDTH) ) & BOARD_MASK
+
+
+
+"""
+Zobrist hashing: https://en.wikipedia.org/wiki/Zobrist_hashing
+Every (piece, index) pair gets a random 64-bit key, and so does the red player's turn.
+The hash of a board is all of its keys XOR'd together, so when a piece moves you 
+just XOR out its old key and XOR in the new one (no need to loop over the board).
+-->uses a fixed seed so that hashes are the same every time the program runs.
+"""
+_zobristRandom = random.Random(2021)
+ZOBRIST_KEYS = {pieceNum: [_zobristRandom.getrandbits(64) for i in range(len(EMPTY_BOARD))] for pieceNum in sorted(PIECE_VALUES)}
+ZOBRIST_RED_TO_MOVE = _zobristRandom.getrandbits(64)
+
+"""
+Board score tables: PIECE_SQUARE_VALUES[pieceNum][idx] is what that piece is worth on that space (or pool index),
+from white's perspective. The score of a board is the sum over all its pieces, so (like the zobrist key) a move
+only changes it by the moved piece's old and new values, and the captured piece's value - see moveScoreDelta.
+-->right now it's just material (PIECE_VALUES, the same on every space), but positional bonuses can go straight
+   into these tables without making evaluation() any slower.
+"""
+PIECE_SQUARE_VALUES = {pieceNum: [value] * len(EMPTY_BOARD) for pieceNum, value in PIECE_VALUES.items()}
+
+"""
+returns how much the given move changes the board's score
+"""
+def moveScoreDelta(move):
+    values = PIECE_SQUARE_VALUES[move.int_piece]
+    delta = values[move.dest_idx] - values[move.start_idx]
+    if move.dest_val > 0:
+        delta -= PIECE_SQUARE_VALUES[move.dest_val][move.dest_idx]
+    return delta
+
+"""
+returns the Zobrist hash of a whole board (only used when a BoardState is made from scratch)
+"""
+def zobristHash(board, turnPlayer):
+    key = ZOBRIST_RED_TO_MOVE if turnPlayer == RED_TEAM else 0
+    for idx, val in enumerate(board):
+        if val > 0:
+            key ^= ZOBRIST_KEYS[val][idx]
+    return key
+
+
+"""
+Board symmetries: the board (and the temples, and the predefined spaces) looks the same after rotating 
+or reflecting it, and none of the moves depend on direction, so a position and its mirror images are 
+really the same position: same moves (turned around the same way), same evaluation.
+SYMMETRIES[t] is a list of where every index goes under transform t (the pools don't move):
+0 = no change, 1-3 = rotated 90/180/270 degrees, 4-7 = reflected (left/right, up/down, and the 2 diagonals).
+-->a position's "canonical" version is the one of its 8 versions with the smallest zobrist key (see BoardState.canonicalKey)
+"""
+def symmetricCoord(t, row, col):
+    last = BOARD_WIDTH - 1
+    return [(row, col), (col, last-row), (last-row, last-col), (last-col, row),
+            (row, last-col), (last-row, col), (col, row), (last-col, last-row)][t]
+
+SYMMETRIES = [[index(*symmetricCoord(t, *coord(idx))) if idx < WHITE_POOL else idx for idx in range(len(EMPTY_BOARD))] 
+              for t in range(8)]
+#SYMMETRY_INVERSES[t] undoes transform t; SYMMETRY_PRODUCTS[a][b] is the same as doing transform b and then a
+SYMMETRY_PRODUCTS = [[SYMMETRIES.index([SYMMETRIES[a][SYMMETRIES[b][idx]] for idx in range(len(EMPTY_BOARD))]) for b in range(8)] 
+                     for a in range(8)]
+SYMMETRY_INVERSES = [SYMMETRY_PRODUCTS[t].index(0) for t in range(8)]
+
+"""
+returns the given move, turned around by transform t (see SYMMETRIES)
+"""
+def transformMove(move, t):
+    symmetry = SYMMETRIES[t]
+    return getMove(move.int_piece, symmetry[move.start_idx], symmetry[move.dest_idx], move.dest_val, move.isCapture, move.isPlacement)
+
+
+
+"""
+returns a tuple of the board indices you pass going from idx in direction d, 
+in order (nearest first), up to the edge of the board. 
+@param d is a (row, col) change, like (-1, 0) for up
+"""
+def getRay(idx, d):
+    row, col = idx//BOARD_WIDTH + d[0], idx%BOARD_WIDTH + d[1]
+    ray = []
+    while (row, col) in BOARD_COORDS:
+        ray.append((row*BOARD_WIDTH) + col)
+        row += d[0]
+        col += d[1]
+    return tuple(ray)
+
+#cache the rays from every board space (so wheel and badgermole moves just loop over a tuple instead of doing row/col math)
+#wheels go diagonally (same direction order as WHEEL_DIRECTIONS), badgermoles jump up/down/left/right
+DIAGONAL_RAYS = {idx: tuple(getRay(idx, d) for d in ((-1, -1), (-1, 1), (1, -1), (1, 1))) for idx in BOARD_INDICES}
+ORDINAL_RAYS = {idx: tuple(getRay(idx, d) for d in ORDINAL_DIRECTIONS) for idx in BOARD_INDICES}
+
 """
 returns the set of all indices in a diagonal line from the given idx
 (like how a wheel piece moves)
 """
 def getIndicesInLine(idx):
-    start_row, start_col = idx//BOARD_WIDTH, idx%BOARD_WIDTH #convert idx to row&col
-    indices = set()
-    for d in DIAGONAL_DIRECTIONS:
-        #keep checking only while the space diagonal from current position is valid.
-        row = start_row + d[0]
-        col = start_col + d[1]
-        while (row, col) in BOARD_COORDS:
-            end_idx = (row*BOARD_WIDTH) + col #convert (row,col) to int index
-            indices.add(end_idx)
-            row += d[0]
-            col += d[1]
-    return indices
+    return {end_idx for ray in DIAGONAL_RAYS[idx] for end_idx in ray}
+
+#bitboard of the spaces diagonally in line with each board space
+LINE_MASKS = {idx: indicesToMask(getIndicesInLine(idx)) for idx in BOARD_INDICES}
 
 
 """
@@ -640,9 +1231,8 @@ Returns set of indices of a player's pieces of a given type(s) that are on the b
 @param types_set is a set of piece types (like {BISON, WHEEL} )
 """
 def pieceIndicesOnBoard(boardState, players_set, types_set):
-    return {boardState.pieceLocations[p] for p in boardState.pieceLocations
-            if boardState.pieceLocations[p] < WHITE_POOL
-            and p//10%10 in types_set and p//100 in players_set}
+    pieceIndex = boardState.pieceIndex
+    return {idx for player in players_set for typ in types_set for idx in pieceIndex[(player, typ, True)]}
 
 
 
@@ -664,7 +1254,7 @@ def placementMoves(boardState, pieceNum, start_idx):
     
     #if piece is a bison, return empty temples (bc skybisons must be placed on temples)
     if typ == BISON: 
-        return [Move(pieceNum, start_idx, t, EMPTY, isPlacement=True) for t in TEMPLE_INDICES if boardState.board[t] == EMPTY]
+        return [PLACEMENT_MOVES[pieceNum][t] for t in TEMPLE_INDICES if boardState.board[t] == EMPTY]
         
     #if piece is a Dragon, return empty spaces <5 spaces from firelily
     elif typ == DRAGON:
@@ -676,12 +1266,13 @@ def placementMoves(boardState, pieceNum, start_idx):
         # otherwise get all empty spaces within 5 of the lily
         lily_idx = boardState.pieceLocations[lilyNum]
         end_indices = getIndicesWithinN(lily_idx, n=5)
-        return [Move(pieceNum, start_idx, end_idx, EMPTY, isPlacement=True) 
-                for end_idx in end_indices if boardState.board[end_idx] == EMPTY and end_idx not in TEMPLE_INDICES]
+        placements = PLACEMENT_MOVES[pieceNum]
+        return [placements[end_idx] for end_idx in end_indices if boardState.board[end_idx] == EMPTY and end_idx not in TEMPLE_INDICES]
         
     #for non-bison pieces, just return all empty board spaces (non-temples)
     else: 
-        return [Move(pieceNum, start_idx, end_idx, EMPTY, isPlacement=True) for end_idx in boardState.emptyIndices]
+        placements = PLACEMENT_MOVES[pieceNum]
+        return [placements[end_idx] for end_idx in boardState.emptyIndices]
     
     
     
@@ -708,52 +1299,52 @@ def placementMoves_Limited(boardState, pieceNum, start_idx):
     TEMPLES = TEMPLE_INDICES
     
     board = boardState.board
+    placements = PLACEMENT_MOVES[pieceNum] #the preallocated placement Moves for this piece
     typ = pieceNum // 10 % 10
     player = pieceNum // 100
     enemyPlayer = 1 + player%2
     
     #Skybisons must be placed on empty temples
     if typ == BISON: 
-        return [Move(pieceNum, start_idx, t, EMPTY_0, isPlacement=True) for t in TEMPLES if board[t] == EMPTY_0]
+        return [placements[t] for t in TEMPLES if board[t] == EMPTY_0]
     
     #if piece is a Dragon, return empty spaces <5 spaces from firelily
     elif typ == DRAGON:
-        # get all empty spaces within 5 of the lily
-        end_indices = boardState.fireLilyRadii[player]
-        return [Move(pieceNum, start_idx, end_idx, EMPTY_0, isPlacement=True) 
-                for end_idx in end_indices if board[end_idx] == EMPTY_0 and end_idx not in TEMPLES]
+        # get all empty spaces within 5 of the lily (no spaces if the lily is in the pool)
+        lily_idx = boardState.pieceLocations.get(player*100 + FIRELILY*10, -1)
+        return [placements[end_idx] for end_idx in maskToIndices(WITHIN_5_MASKS.get(lily_idx, 0) & boardState.emptyMask)]
     
-    #the other piece types:
-    spaces = set()
+    #the other piece types: build a bitboard of spaces
+    spaces = 0
     
     #Badgermoles can be placed adjacent to your flowers
     if typ == BADGER:
         #get all spaces adj to your flowers
         for idx in pieceIndicesOnBoard(boardState, {player}, {CHRYS, LOTUS, FIRELILY}):
-            spaces |= getAdjacentIndices(idx) #union
+            spaces |= ADJACENT_MASKS[idx] #union
         #also add some pre-defined spaces
-        spaces |= PREDEFINED_BADGERMOLE_SPACES
+        spaces |= PREDEFINED_BADGERMOLE_MASK
         
     #Crysanthemums can be placed 1) adjacent to enemy bison and 2) diagonal to your flowers
     elif typ == CHRYS:
         #get all spaces adjacent to enemy bisons
         for idx in pieceIndicesOnBoard(boardState, {enemyPlayer}, {BISON}):
-            spaces |= getAdjacentIndices(idx) #union
+            spaces |= ADJACENT_MASKS[idx] #union
         #get all spaces diagonal to your lotus and firelily
         for idx in pieceIndicesOnBoard(boardState, {player}, {LOTUS, FIRELILY}):
-            spaces |= getDiagonalIndices(idx)
+            spaces |= DIAGONAL_MASKS[idx]
         
     #Firelilies can be placed 1) at a few pre-defined spaces in the middle, 
     #2) within striking distance of either lotus (5 spaces), or 3) adjacent to badgermoles
     elif typ == FIRELILY:
         #get all spaces within 5 of a lotus
         for idx in pieceIndicesOnBoard(boardState, {WHITE_TEAM, RED_TEAM}, {LOTUS}):
-            spaces |= getIndicesWithinN(idx, n=5)
+            spaces |= WITHIN_5_MASKS[idx]
         #get all spaces adjacent to badgermoles
         for idx in pieceIndicesOnBoard(boardState, {player}, {BADGER}):
-            spaces |= getAdjacentIndices(idx)
+            spaces |= ADJACENT_MASKS[idx]
         #add all the pre-defined spaces
-        spaces |= PREDEFINED_FIRELILY_SPACES
+        spaces |= PREDEFINED_FIRELILY_MASK
         
     
         
@@ -764,12 +1355,12 @@ def placementMoves_Limited(boardState, pieceNum, start_idx):
     elif typ == LOTUS:
         #get all spaces adjacent to your badgermoles
         for idx in pieceIndicesOnBoard(boardState, {player}, {BADGER}):
-            spaces |= getAdjacentIndices(idx)
+            spaces |= ADJACENT_MASKS[idx]
         #get all spaces diagonal to your other flowers
         for idx in pieceIndicesOnBoard(boardState, {player}, {FIRELILY, CHRYS}):
-            spaces |= getDiagonalIndices(idx)
+            spaces |= DIAGONAL_MASKS[idx]
         #add pre-defined spaces
-        spaces |= PREDEFINED_LOTUS_SPACES
+        spaces |= PREDEFINED_LOTUS_MASK
         
     
     #if piece is a wheel, only place in line with another piece.
@@ -777,15 +1368,14 @@ def placementMoves_Limited(boardState, pieceNum, start_idx):
     #so: get all spaces diagonally in line with a piece (either player)
     elif typ == WHEEL:
         for idx in pieceIndicesOnBoard(boardState, {player, enemyPlayer}, ALL_TYPES):
-            spaces |= getIndicesInLine(idx)
+            spaces |= LINE_MASKS[idx]
         
     #shouldn't reach here
     else: 
         raise Exception("HEY, A PROBLEM!! Invalid piece type?")
     
     #return placement moves to all calculated spaces that are empty and not temples
-    # return [Move(pieceNum, start_idx, s, EMPTY_0, isPlacement=True) for s in spaces if board[s]==EMPTY_0 and s not in TEMPLES]
-    return [Move(pieceNum, start_idx, s, EMPTY_0, isPlacement=True) for s in spaces if s in boardState.emptyIndices]
+    return [placements[s] for s in maskToIndices(spaces & boardState.emptyMask)]
 
 
 
@@ -796,7 +1386,7 @@ Helper for calcLotusMoves and calcBadgermoleMoves
 - returns a list of non-capture moves to empty adjacent spaces.
 """    
 def adjMoves(boardState, pieceNum, start_idx):
-    return [Move(pieceNum, start_idx, end_idx, EMPTY) for end_idx in getAdjacentIndices(start_idx) 
+    return [getMove(pieceNum, start_idx, end_idx, EMPTY) for end_idx in getAdjacentIndices(start_idx) 
             if (end_idx not in TEMPLE_INDICES) and (boardState.board[end_idx] == EMPTY)]
            
 
@@ -838,27 +1428,18 @@ def calcBadgermoleMoves(boardState, pieceNum, start_idx, placementMovesFctn=plac
     
     #badgermoles can also jump to flowers if there is a straight-line path
     board = boardState.board
-    start_row, start_col = coord(start_idx)
-    for d in ORDINAL_DIRECTIONS:
-        #keep checking only while the next space is valid.
-        row = start_row + d[0]
-        col = start_col + d[1]
-        
-        while (row, col) in BOARD_COORDS: #while isOnBoard(row,col)
-            end_idx = (row*BOARD_WIDTH) + col #convert (row,col) to int index
+    for ray in ORDINAL_RAYS[start_idx]:
+        for dist, end_idx in enumerate(ray):
             boardVal = board[end_idx]
             # If it hits a flower, add prev. space to list. Then stop looking in this direction.
             if boardVal//10%10 in FLOWERS: 
-                row -= d[0] #get prev space
-                col -= d[1]
-                if not areAdjCoords(row, col, start_row, start_col): #only add as move if not adjacent (must be a jump over 2 or more spaces - to avoid duplicate moves)
-                    prev_end_idx = index(row, col)
-                    moves.append(Move(pieceNum, start_idx, prev_end_idx, board[prev_end_idx], isCapture=False))
+                if dist >= 2: #only add as move if not adjacent (must be a jump over 2 or more spaces - to avoid duplicate moves)
+                    prev_end_idx = ray[dist-1]
+                    moves.append(getMove(pieceNum, start_idx, prev_end_idx, board[prev_end_idx]))
                 break
-            # If it's empty space, add move to list and continue looking in this direction.
+            # If it's empty space, continue looking in this direction.
             elif end_idx not in TEMPLE_INDICES and boardVal == EMPTY:
-                row += d[0]
-                col += d[1]
+                continue
             #if it's anything else then break
             else:
                 break
@@ -875,22 +1456,21 @@ def calcWheelMoves(boardState, pieceNum, start_idx, placementMovesFctn=placement
     if start_idx >= WHITE_POOL:
         return placementMovesFctn(boardState, pieceNum, start_idx)
     
-    #look diagonally in each direction
+    #look diagonally in each direction (the rays stop at the edge of the board)
+    board = boardState.board
+    emptyIndices = boardState.emptyIndices
     moves = []
-    for d, edges in WHEEL_DIRECTIONS:
-        idx = start_idx
-        while idx not in edges:
-            #check space up-left of index
-            idx += d
-            boardVal = boardState.board[idx]
+    for ray in DIAGONAL_RAYS[start_idx]:
+        for idx in ray:
+            boardVal = board[idx]
             
             #is it empty? add to moves and keep looping
-            if idx in boardState.emptyIndices:
-                moves.append(Move(pieceNum, start_idx, idx, boardVal))
+            if idx in emptyIndices:
+                moves.append(getMove(pieceNum, start_idx, idx, EMPTY))
                 
             #if it's a piece that can be captured, add move and break
             elif canCapture(pieceNum, boardVal, idx, boardState):
-                moves.append(Move(pieceNum, start_idx, idx, boardVal, isCapture=True))
+                moves.append(getMove(pieceNum, start_idx, idx, boardVal, isCapture=True))
                 break
             
             #if it can't be captured, stop looping
@@ -942,17 +1522,17 @@ def calcDragonMoves(boardState, pieceNum, start_idx, placementMovesFctn=placemen
         boardVal = boardState.board[end_idx]
         #move to empty space
         if end_idx in boardState.emptyIndices:
-            moves.append( Move(pieceNum, start_idx, end_idx, boardVal) )
+            moves.append( getMove(pieceNum, start_idx, end_idx, EMPTY) )
         #capture a piece
         elif canCapture(pieceNum, boardVal, end_idx, boardState): 
-            moves.append( Move(pieceNum, start_idx, end_idx, boardVal, isCapture=True) )
+            moves.append( getMove(pieceNum, start_idx, end_idx, boardVal, isCapture=True) )
     
     return moves
     
     
 """
 Calculates all moves a SkyBison can make.
-This is a breadth-first traversal, adding adjacent spaces to a queue until you run out of steps.
+This is a breadth-first search out to maxSteps spaces (see skyBisonReach).
 @param startIdx is the starting board index of the bison (int)
 @param maxSteps should always be 6 because bison can move a max of 6 spaces
 """
@@ -961,48 +1541,48 @@ def calcSkyBisonMoves(boardState, pieceNum, startIdx, maxSteps=6, placementMoves
     if startIdx >= WHITE_POOL:
         return placementMovesFctn(boardState, pieceNum, startIdx)
     
-    elif isTrapped(pieceNum, startIdx, boardState):
-        return []
-    
-    player = pieceNum//100
-    enemyPlayer = 1 + player % 2
-    trappedIndices = boardState.trappedIndices[player]
-    ADJACENT_INDICES_loc = ADJACENT_INDICES #store global as local
-    
-    enemy_terr = boardState.bisonTerritories[enemyPlayer]
-    offLimits = {startIdx} #a set of indices where the bison cannot end on: enemy territories and its starting space
-    queue = [(startIdx, 0)] # spaces to visit next (tuples of (board_idx, num_steps_to_get_there) )
-    moves = [] #list of final moves to return
-    steps = 0  #up to 6 steps
-    visited = set() #indices you have analyzed adjacent tiles for already
-    
-    #the rest of the spaces:
-    while queue:
-        cur_idx, steps = queue.pop(0) #pop first item
-        visited.add(cur_idx) #mark current idx as visited
-        
-        #add current space to final list, if it's not off-limits (aka. enemy bison territory)
-        if (cur_idx not in offLimits) and (cur_idx not in enemy_terr):
-            moves.append( Move(pieceNum, startIdx, cur_idx, EMPTY) )
-            offLimits.add(cur_idx) #prevent duplicate moves
-            
-        #look at adjacent spaces if not trapped, and distance is less than max
-        if steps < maxSteps and not (cur_idx in trappedIndices):
-            for a in ADJACENT_INDICES_loc[cur_idx]:
-                if a not in visited:
-                    boardVal = boardState.board[a]
-                    #if it's empty, add to queue (so as to look at its adj spaces)
-                    # if (boardVal == 0) and (a not in TEMPLE_INDICES):
-                    if a in boardState.emptyIndices:
-                        queue.append( (a,steps+1) )
-                    #If it's a takeable piece, add to finalSpaces as a capture move. (can capture on temples)
-                    elif canCapture(pieceNum, boardVal, a, boardState) and (a not in offLimits) and (a not in enemy_terr):
-                        moves.append( Move(pieceNum, startIdx, a, boardVal, isCapture=True) )
-                        offLimits.add(cur_idx) #prevent duplicate moves
-                    #otherwise, it's your own piece, so you can't walk into it. Do nothing.         
+    moveMask, captureMask = skyBisonReach(boardState, pieceNum//100, startIdx, maxSteps)
+    board = boardState.board
+    moves = [getMove(pieceNum, startIdx, idx, EMPTY) for idx in maskToIndices(moveMask)]
+    moves.extend(getMove(pieceNum, startIdx, idx, board[idx], isCapture=True) for idx in maskToIndices(captureMask))
     return moves
 
 
+"""
+Breadth-first search for a sky bison, done with bitboards: each step, the frontier is every 
+space the bison can first reach in that many steps, so one step is just adjacentMask(frontier).
+- the bison walks through empty spaces (not temples), and can't keep walking from a space where it would be trapped
+- it can capture anything capturable next to a space it walked from (or next to its start)
+- it can't end its move in enemy bison territory
+Returns a tuple of bitboards (empty spaces it can move to, spaces it can capture on). Both are 0 if it's trapped.
+"""
+def skyBisonReach(boardState, player, startIdx, maxSteps=6):
+    trappedMask = boardState.trappedMask(player)
+    if (trappedMask >> startIdx) & 1:
+        return 0, 0
+    
+    #the bison can't get further than 6 steps away, so only look at empty spaces within 6
+    walkable = boardState.emptyMask
+    if maxSteps <= 6:
+        walkable &= WITHIN_6_MASKS[startIdx]
+    
+    reached = 0 #empty spaces the bison can walk to
+    touched = 0 #spaces next to a space the bison walked from (where it could capture)
+    frontier = 1 << startIdx
+    for step in range(maxSteps):
+        adjacent = adjacentMask(frontier)
+        touched |= adjacent
+        frontier = adjacent & walkable & ~reached
+        reached |= frontier
+        frontier &= ~trappedMask #trapped spaces can be reached, but not walked through
+        if not frontier:
+            break
+    
+    ones, twos = boardState.bisonCoverage[1 + player%2]
+    enemyTerritory = ones | twos
+    return reached & ~enemyTerritory, touched & boardState.capturableMask(player) & ~enemyTerritory
+
+
 
 MOVE_FUNCTIONS = {LOTUS: calcLotusMoves, BISON: calcSkyBisonMoves, 
                       WHEEL: calcWheelMoves, BADGER: calcBadgermoleMoves, 
@@ -1011,6 +1591,60 @@ MOVE_FUNCTIONS = {LOTUS: calcLotusMoves, BISON: calcSkyBisonMoves,
 
 
 
+#-------------------------------------------------------------------------------
+# 
+# Calculating just the capture moves (for getCaptureMoves)
+# -->these assume the piece is on the board
+#
+#-------------------------------------------------------------------------------
+
+"""
+Returns a list of capture Moves for a given Wheel piece.
+Like calcWheelMoves, but only keeps the piece at the end of each diagonal.
+"""
+def calcWheelCaptures(boardState, pieceNum, start_idx):
+    board = boardState.board
+    emptyIndices = boardState.emptyIndices
+    moves = []
+    for ray in DIAGONAL_RAYS[start_idx]:
+        for idx in ray:
+            if idx not in emptyIndices:
+                boardVal = board[idx]
+                if canCapture(pieceNum, boardVal, idx, boardState):
+                    moves.append(getMove(pieceNum, start_idx, idx, boardVal, isCapture=True))
+                break
+    return moves
+
+
+"""
+Returns a list of capture Moves for a given Dragon piece: capturable spaces within 5 of its fire lily.
+"""
+def calcDragonCaptures(boardState, pieceNum, start_idx):
+    player = pieceNum//100
+    lily_idx = boardState.pieceLocations.get(player*100 + FIRELILY*10, -1)
+    board = boardState.board
+    return [getMove(pieceNum, start_idx, end_idx, board[end_idx], isCapture=True) 
+            for end_idx in maskToIndices(WITHIN_5_MASKS.get(lily_idx, 0) & boardState.capturableMask(player))]
+
+
+"""
+Returns a list of capture Moves for a given Sky Bison.
+"""
+def calcSkyBisonCaptures(boardState, pieceNum, start_idx):
+    moveMask, captureMask = skyBisonReach(boardState, pieceNum//100, start_idx)
+    board = boardState.board
+    return [getMove(pieceNum, start_idx, idx, board[idx], isCapture=True) for idx in maskToIndices(captureMask)]
+
+
+
+CAPTURE_FUNCTIONS = {BISON: calcSkyBisonCaptures, WHEEL: calcWheelCaptures, DRAGON: calcDragonCaptures}
+
+#the pieces each player can capture with
+CAPTURING_PIECES = {WHITE_TEAM: (W_WHEEL_1, W_WHEEL_2, W_DRAGON) + W_BISONS, 
+                    RED_TEAM:   (R_WHEEL_1, R_WHEEL_2, R_DRAGON) + R_BISONS}
+
+
+
 
 #*******************************************************************************
 # 
@@ -1023,7 +1657,7 @@ MOVE_FUNCTIONS = {LOTUS: calcLotusMoves, BISON: calcSkyBisonMoves,
 Class representing a state transition.(aka a "move")
 """
 class Move:
-    __slots__ = ["int_piece", "start_idx", "dest_idx", "dest_val", "isCapture", "isPlacement"] # saves memory & faster https://stackoverflow.com/questions/472000/usage-of-slots
+    __slots__ = ["int_piece", "start_idx", "dest_idx", "dest_val", "isCapture", "isPlacement", "code"] # saves memory & faster https://stackoverflow.com/questions/472000/usage-of-slots
     def __init__(self, int_piece, start_idx, dest_idx, dest_val, isCapture=False, isPlacement=False):
         self.int_piece = int_piece   #int id of the moving piece
         self.start_idx = start_idx
@@ -1031,6 +1665,7 @@ class Move:
         self.dest_val = dest_val     #value of the board at destination (empty or a piece num)
         self.isCapture = isCapture
         self.isPlacement = isPlacement
+        self.code = encodeMove(int_piece, start_idx, dest_idx, dest_val, isCapture, isPlacement) #this move packed into one int
         
     """
     Overriding the built-in equals method (for comparisons using the == operator and such)
@@ -1055,12 +1690,160 @@ class Move:
         return s
 
     """
-    Returns a unique string identifier for this move -> used as dict keys, etc.
-    -->just concatenates together the piece to move, the start space, and end space.
+    Returns a unique int identifier for this move -> used as dict keys, etc.
+    -->this is the move's code (see encodeMove), so there's nothing to calculate here.
     -->use the toString if you want a readable description
     """
     def hashThis(self):
-        return "".join([str(self.int_piece), str(self.start_idx), str(self.dest_idx)]) 
+        return self.code
+
+
+
+"""
+Moves packed into a single int (the "code"), so they're cheap to store and use as dict keys:
+    bits 0-4:   the moving piece      (as its number in PIECE_CODES)
+    bits 5-13:  start index
+    bits 14-22: destination index
+    bits 23-27: piece at destination  (as its number in PIECE_CODES; EMPTY is 0)
+    bit  28:    isCapture
+    bit  29:    isPlacement
+"""
+CODE_PIECES = [EMPTY] + sorted(PIECE_VALUES) + [BOUNDARY] #PIECE_CODES in reverse: code number -> piece int
+PIECE_CODES = {pieceNum: i for i, pieceNum in enumerate(CODE_PIECES)}
+CAPTURE_FLAG = 1 << 28
+PLACEMENT_FLAG = 1 << 29
+
+"""
+returns the int code of a move (see above)
+"""
+def encodeMove(int_piece, start_idx, dest_idx, dest_val, isCapture=False, isPlacement=False):
+    code = PIECE_CODES[int_piece] | (int(start_idx) << 5) | (int(dest_idx) << 14) | (PIECE_CODES[dest_val] << 23)
+    if isCapture: code |= CAPTURE_FLAG
+    if isPlacement: code |= PLACEMENT_FLAG
+    return code
+
+"""
+unpacks a move's int code into (int_piece, start_idx, dest_idx, dest_val, isCapture, isPlacement)
+"""
+def decodeMove(code):
+    return (CODE_PIECES[code & 31], (code >> 5) & 511, (code >> 14) & 511, CODE_PIECES[(code >> 23) & 31], 
+            bool(code & CAPTURE_FLAG), bool(code & PLACEMENT_FLAG))
+
+
+
+"""
+The Move table: one shared Move object for every move code (a "flyweight"), 
+so the move functions don't allocate a new Move for every option they find.
+Moves are never edited after they're made, so it's safe for everything to share them.
+-->all placement moves are made ahead of time (PLACEMENT_MOVES); 
+   other moves are made the first time they come up and reused after that.
+"""
+MOVE_TABLE = {}
+
+"""
+returns the shared Move object for the given code (makes it if it's the first time)
+"""
+def moveFromCode(code):
+    move = MOVE_TABLE.get(code)
+    if move is None:
+        move = MOVE_TABLE[code] = Move(*decodeMove(code))
+    return move
+
+"""
+returns the shared Move object for a move (same arguments as the Move constructor)
+"""
+def getMove(int_piece, start_idx, dest_idx, dest_val, isCapture=False, isPlacement=False):
+    code = PIECE_CODES[int_piece] | (start_idx << 5) | (dest_idx << 14) | (PIECE_CODES[dest_val] << 23)
+    if isCapture: code |= CAPTURE_FLAG
+    if isPlacement: code |= PLACEMENT_FLAG
+    move = MOVE_TABLE.get(code)
+    if move is None:
+        move = MOVE_TABLE[code] = Move(int_piece, start_idx, dest_idx, dest_val, isCapture, isPlacement)
+    return move
+
+"""
+dict of each piece's placement Moves, as a list indexed by destination (None for spaces off the board)
+-->pieces always start in the same spot in the pool, so these can all be made before the game starts.
+"""
+PLACEMENT_MOVES = {}
+for _pool_idx in range(WHITE_POOL, len(EMPTY_BOARD)):
+    _pieceNum = int(EMPTY_BOARD[_pool_idx])
+    if _pieceNum > 0:
+        PLACEMENT_MOVES[_pieceNum] = [getMove(_pieceNum, _pool_idx, dest, EMPTY, isPlacement=True) if dest in BOARD_INDICES else None 
+                                      for dest in range(WHITE_POOL)]
+
+
+"""
+A bounded cache of generated moves, keyed by position (zobrist key - see BoardState.hashThis).
+When it's full, the position that was used least recently is thrown out ("LRU").
+The moves are stored as a tuple: it can't be changed by accident, and since Moves are shared 
+(see getMove) it's just one pointer per move.
+-->hits and misses count how often it had the moves already, so you can tell if it's big enough.
+-->it has its own lock, since search threads share it (see monteCarlo_parallel_AI.TreeParallelMonteCarlo)
+"""
+class MoveCache:
+    
+    """
+    @param maxSize - the most positions to remember (0 turns the cache off)
+    """
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict() #position key -> tuple of Moves, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    """
+    returns the cached moves for a position key (and marks it as just used), or None if they're not cached
+    """
+    def get(self, key):
+        with self.lock:
+            moves = self.entries.get(key)
+            if moves is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return moves
+    
+    """
+    stores the moves for a position key (throwing out the least recently used position if it's full)
+    """
+    def put(self, key, moves):
+        if self.maxSize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = moves
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+    
+    """
+    empties the cache and resets the counters
+    """
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    """
+    returns the fraction of lookups that were hits
+    """
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+    
+    """
+    Give a descriptor of the cache and its counters (for printing)
+    """
+    def toString(self):
+        return "{}/{} positions, {} hits, {} misses ({:.0%} hit rate)".format(len(self.entries), self.maxSize, 
+                                                                            self.hits, self.misses, self.hitRate())
+
+#how many positions' moves to remember (a position's moves take up ~2KB in the cache)
+MOVE_CACHE_SIZE = 4096
+MOVE_CACHE = MoveCache(MOVE_CACHE_SIZE)
 
 
 
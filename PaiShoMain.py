@@ -15,7 +15,7 @@ import pygame as p
 import math
 import numpy as np
 from constants2 import LOTUS, BISON, WHEEL, BADGER, CHRYS, FIRELILY, DRAGON, EMPTY, BOUNDARY, WHITE_POOL_ROW
-from PaiShoEngine import startState, index, coord, getVal, Move
+from PaiShoEngine import startState, index, coord, getVal, Move, MOVE_CACHE
 import monteCarlo_with_eval_AI
 from button import Button
 
@@ -111,6 +111,7 @@ def main():
     timeChoiceIdx = 2 #default timeOption choice (start at 30sec)
     outputMessage = "Welcome!"
     calculateMove = False
+    mcts = monteCarlo_with_eval_AI.MonteCarlo() #keep the same search between turns, so it can reuse its tree
     
     #game loop
     running = True
@@ -215,6 +216,7 @@ def main():
             selectedPoint, startCoord, endCoord = (), (), ()
             selectedPiece = -1
             selectedPieceMoves = []
+            mcts = monteCarlo_with_eval_AI.MonteCarlo() #new game: forget the old search tree
             outputMessage = "Reset Game."
         
         #CALCULATE BUTTON HANDLER: have the cpu make a move
@@ -250,9 +252,9 @@ def main():
             print("Analyzing", len(boardState.getAllMoves_Limited()), "moves.")
             print("Note: The game window will not respond until finished calculating.")
             # mcts = monteCarlo_AI.MonteCarlo()
-            mcts = monteCarlo_with_eval_AI.MonteCarlo()
             m = mcts.runSearch(boardState, thinkTime)
             print("move performed", m.toString())
+            print("move cache:", MOVE_CACHE.toString())
 #            mcts.printTree(boardState) #debugging
             outputMessage = m.toString()
             boardState = boardState.nextState(m) #perform move
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo Tree Search (MCTS) AI, with the search tree stored in numpy arrays.
+
+This is the same search as monteCarlo_with_eval_AI (MCTS + an evaluation function
+at the end of short playouts), but the tree doesn't use MonteCarloNode objects:
+- a node is just an int id. Its stats are visits[id], valueSums[id], parents[id] etc.
+  (one array per stat, aka "struct of arrays")
+- all of a node's children are stored next to each other, from firstChild[id] to firstChild[id] + numChildren[id] - 1.
+  They're shuffled when they're added, so expanding a random child is just taking the next one (numExpanded[id]).
+- nodes don't store a BoardState, just the code of the move that leads to them (see PaiShoEngine.encodeMove).
+  Each iteration plays the moves from the root on one scratch BoardState (makeMove) and unmakes them at the end.
+
+So a node costs ~30 bytes instead of a whole BoardState (numpy board, a bunch of sets, ...),
+which is what used to run out of memory on the long think times.
+
+References:
+-Same algorithm as monteCarlo_with_eval_AI.py (see there)
+-Possible memory issues: http://orangehelicopter.com/academic/papers/powley_aiide17.pdf
+"""
+
+import math
+import time
+import random
+import numpy as np
+from constants2 import RED_TEAM
+from PaiShoEngine import BoardState, moveFromCode
+from monteCarlo_with_eval_AI import SIMULATION_DEPTH_CUTOFF
+
+
+# =============================================================================
+# TREE STORAGE
+# =============================================================================
+
+"""
+The search tree, as a set of preallocated numpy arrays indexed by node id.
+The arrays double in size whenever they run out of room.
+"""
+class SearchTree:
+
+    """
+    @param capacity - how many nodes to make room for at first
+    """
+    def __init__(self, capacity=4096):
+        self.size = 0 #number of nodes in use
+        self.visits = np.zeros(capacity, dtype=np.int32)         #n_moves: how many simulations went through this node
+        self.valueSums = np.zeros(capacity, dtype=np.float64)    #n_wins: sum of the evaluations backpropagated through this node
+        self.parents = np.full(capacity, -1, dtype=np.int32)     #id of the parent node (-1 for the root)
+        self.firstChild = np.full(capacity, -1, dtype=np.int32)  #id of the first child (-1 if the node's moves haven't been generated yet)
+        self.numChildren = np.zeros(capacity, dtype=np.int32)    #number of legal moves from this node
+        self.numExpanded = np.zeros(capacity, dtype=np.int32)    #number of children that have been expanded (they're always the first ones)
+        self.moveCodes = np.zeros(capacity, dtype=np.int32)      #code of the Move from the parent to this node
+
+    """number of nodes the arrays have room for"""
+    def capacity(self):
+        return len(self.visits)
+
+    """approximate memory used by the tree, in bytes"""
+    def nbytes(self):
+        return sum(arr.nbytes for arr in (self.visits, self.valueSums, self.parents, self.firstChild,
+                                          self.numChildren, self.numExpanded, self.moveCodes))
+
+    """
+    make sure there's room for at least `needed` nodes (doubles the arrays until there is)
+    """
+    def reserve(self, needed):
+        capacity = self.capacity()
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, fill in (("visits", 0), ("valueSums", 0), ("parents", -1), ("firstChild", -1),
+                           ("numChildren", 0), ("numExpanded", 0), ("moveCodes", 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    """
+    adds the root node (no parent, no move) and returns its id
+    """
+    def addRoot(self):
+        self.reserve(self.size + 1)
+        root = self.size
+        self.size += 1
+        return root
+
+    """
+    adds a block of children to the given node, one per move code (in the given order)
+    """
+    def addChildren(self, node, moveCodes):
+        count = len(moveCodes)
+        self.reserve(self.size + count)
+        first = self.size
+        self.parents[first:first+count] = node
+        self.moveCodes[first:first+count] = moveCodes
+        self.firstChild[node] = first
+        self.numChildren[node] = count
+        self.size += count
+
+    """
+    returns the ids of all of a node's children (as a range)
+    """
+    def children(self, node):
+        first = int(self.firstChild[node])
+        return range(first, first + int(self.numChildren[node]))
+
+    """True if every child of the node has been expanded"""
+    def isFullyExpanded(self, node):
+        return self.numExpanded[node] == self.numChildren[node]
+
+    """True if the node has no legal moves (NOT INCLUSIVE of termination due to winning)"""
+    def isLeaf(self, node):
+        return self.numChildren[node] == 0
+
+
+
+# =============================================================================
+# SEARCH
+# =============================================================================
+
+"""
+Class representing the Monte Carlo search (same interface as monteCarlo_with_eval_AI.MonteCarlo).
+"""
+class MonteCarlo:
+
+    """
+    Constructor
+    @param UCB1ExploreParam
+    @param capacity - how many nodes the tree starts with room for (it grows if it needs more)
+    """
+    def __init__(self, UCB1ExploreParam=2, capacity=4096):
+        self.UCB1ExploreParam = UCB1ExploreParam
+        self.capacity = capacity
+        self.tree = None
+        self.rootState = None
+
+
+    """
+    prints the first level of the tree (all moves available from the root)
+    """
+    def printTree(self):
+        tree = self.tree
+        for child in tree.children(0):
+            print(moveFromCode(int(tree.moveCodes[child])).toString(), "|", "n_moves:", tree.visits[child], "|", "n_wins:", tree.valueSums[child])
+
+
+    """
+    returns the move codes of all the moves from a state, in random order
+    (so a node's children can be expanded in order, instead of picking a random unexpanded one each time)
+    """
+    def shuffledMoveCodes(self, boardState):
+        codes = [move.code for move in boardState.getAllMoves_Limited()]
+        random.shuffle(codes)
+        return codes
+
+
+    """
+    From given state, repeatedly run MCTS for the allotted time
+    build the statistics tree, then return the 'best' move.
+    (same 4 phases as monteCarlo_with_eval_AI.MonteCarlo.runSearch)
+
+    @param state - a BoardState to analyze (not changed - the search uses its own copy)
+    @param timeout - float seconds; this is how long to run the calculation for.
+    @return - returns a Move object
+    """
+    def runSearch(self, boardState, timeout):
+        reverse_eval = (boardState.turnPlayer == RED_TEAM) #if it's red player, reverse the eval fctn (times -1)
+
+        #if you can win the game, do it immediately.
+        winMove = boardState.winningMove()
+        if winMove != None:
+            return winMove
+
+        #make the root of the tree, and the scratch state the moves get played on
+        self.tree = SearchTree(self.capacity)
+        self.rootState = BoardState(boardState.board, boardState.turnPlayer, oldState=boardState)
+        state = self.rootState
+        root = self.tree.addRoot()
+        self.tree.addChildren(root, self.shuffledMoveCodes(state))
+        end = time.time() + timeout
+
+        iterations = 0
+
+        #repeat this for the allowed timeout time
+        while (time.time() < end):
+            iterations += 1
+
+            #1. Selection: find the next node to look at (plays the moves to get there on the scratch state)
+            node, depth = self.select(state)
+
+            if not self.tree.isLeaf(node) and state.winner() == -1:   #-1 means no winner yet
+                #2. Expansion: Expand the next unexpanded child node of given node
+                node = self.expand(node, state)
+                depth += 1
+
+            #3. Simulation: play a short game from here, and get the evaluation at the end
+            utility = self.simulate_better(state, reverse_eval)
+
+            #4. Backpropagation: Update ancestor statistics
+            self.backpropagate(node, utility)
+
+            #put the scratch state back to the root
+            for i in range(depth):
+                state.unmakeMove()
+
+            #output for debugging
+            if iterations % 200 ==0:
+                print(iterations, "simulations")
+
+        print("TOTAL SIMULATIONS:", iterations)
+        return self.bestMove()
+
+
+    """
+    Get the best move from available statistics: the root's child with the most visits ("robust child").
+    """
+    def bestMove(self):
+        tree = self.tree
+        if tree.numChildren[0] == 0:
+            return None
+        if not tree.isFullyExpanded(0):
+            print("Root not fully expanded! Might need longer runtime.")
+        print("THERE ARE THIS MANY MOVES:", tree.numChildren[0])
+        children = tree.children(0)
+        best = children[int(np.argmax(tree.visits[children.start:children.stop]))]
+        return moveFromCode(int(tree.moveCodes[best]))
+
+
+    """
+    Phase 1, Selection: Select until you find a node not fully expanded OR leaf.
+    Plays each chosen move on the given state.
+    @return the node id, and how many moves were made to get there
+    """
+    def select(self, state):
+        tree = self.tree
+        node = 0
+        depth = 0
+        while tree.isFullyExpanded(node) and not tree.isLeaf(node):
+            node = self.bestUCB1Child(node)
+            state.makeMove(moveFromCode(int(tree.moveCodes[node])))
+            depth += 1
+        return node, depth
+
+
+    """
+    Returns the child of a (fully expanded) node with the highest UCB1 value.
+    The children's stats are next to each other in the arrays, so this computes 
+    all of their UCB1s at once with numpy instead of looping over them.
+    (same UCB1 as MonteCarloNode.getUCB1: n_wins/n_moves + sqrt(bias) * log(parent.n_moves/n_moves))
+    Ties are broken randomly.
+    """
+    def bestUCB1Child(self, node):
+        tree = self.tree
+        first = int(tree.firstChild[node])
+        last = first + int(tree.numChildren[node])
+        visits = tree.visits[first:last]
+        ucb1 = tree.valueSums[first:last] / visits + math.sqrt(self.UCB1ExploreParam) * np.log(tree.visits[node] / visits)
+        best = np.flatnonzero(ucb1 == ucb1.max())
+        return first + int(best[0] if len(best) == 1 else random.choice(best))
+
+
+    """
+    Phase 2, Expansion: Expand the next unexpanded child node of given node
+    (plays its move on the given state, and adds the child's own children)
+    """
+    def expand(self, node, state):
+        tree = self.tree
+        child = int(tree.firstChild[node] + tree.numExpanded[node])
+        tree.numExpanded[node] += 1
+        state.makeMove(moveFromCode(int(tree.moveCodes[child])))
+        tree.addChildren(child, self.shuffledMoveCodes(state))
+        return child
+
+
+    """
+    Phase 3, Simulation: Play game to terminal state
+    Takes when possible, but random otherwise. (see monteCarlo_with_eval_AI.MonteCarlo.simulate_better)
+    Makes the moves on the given state and unmakes them at the end.
+
+    @return the evaluation of the final board (reversed if red player is calculating)
+    """
+    def simulate_better(self, boardState, reverse_eval, depth_cutoff=SIMULATION_DEPTH_CUTOFF):
+        winner = boardState.winner()
+        count = 0
+        while winner == -1:
+            #if there's a capture available, take it (for simulation purposes)
+            captureMoves = boardState.getCaptureMoves()
+            if captureMoves:
+                move = random.choice(captureMoves)
+            #otherwise, just pick a random move
+            else:
+                allMoves = boardState.getAllMoves_Limited()
+                if not allMoves: break
+                move = random.choice(allMoves)
+            boardState.makeMove(move)
+            winner = boardState.winner()
+            count+=1
+            if count > depth_cutoff:
+                break
+        #get the evaluation score - but reverse the sign if red player is calculating
+        utility = boardState.evaluation()
+        if reverse_eval:
+            utility = -utility
+        for i in range(count):
+            boardState.unmakeMove()
+        return utility
+
+
+    """
+    Phase 4, Backpropagation: Update ancestor statistics with the evaluation.
+    @param node is a new leaf node that you just simulated
+    """
+    def backpropagate(self, node, utility):
+        tree = self.tree
+        while node != -1:
+            tree.visits[node] += 1
+            parent = int(tree.parents[node])
+            if parent == -1: return
+            tree.valueSums[node] += utility
+            node = parent
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel Monte Carlo Tree Search: runs monteCarlo_with_eval_AI on more than one core.
+
+Python threads can't run the search in parallel (the GIL), so this uses worker processes.
+
+Root parallelization (RootParallelMonteCarlo): every worker runs its own independent 
+search from the same position (with a different random seed) for the whole think time. 
+Then the statistics of the root's children are added up across workers, and the best move 
+is picked from the combined statistics. The workers never talk to each other while searching, 
+so N workers is roughly like searching N times as long.
+
+Leaf parallelization (LeafParallelMonteCarlo): there's one tree, in the main process. 
+The main process selects and expands a batch of leaves, and sends them to the workers 
+to run the playouts (as 45 bytes each - see BoardState.toBytes). While the workers play 
+out one batch, the main process already selects the next one.
+
+Tree parallelization (TreeParallelMonteCarlo): threads share one tree, and each one does
+whole iterations (select, expand, playout, backpropagate). Only works in parallel on
+free-threaded (no-GIL) Python 3.13+; on normal Python it just runs one thread.
+
+The last two use "virtual loss": while a leaf's playout is running, every node on its path
+counts as visited once more and as a loss, so the next selection goes somewhere else
+instead of picking the same leaf again. The real result replaces it when the playout's done.
+
+References:
+-"Parallel Monte-Carlo Tree Search" (Chaslot, Winands, van den Herik, 2008)
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+import multiprocessing
+from constants2 import RED_TEAM
+from PaiShoEngine import BoardState, moveFromCode, boardStateFromBytes
+from monteCarlo_with_eval_AI import MonteCarlo, MonteCarloNode, uniqueNodes
+
+#the worst evaluation a playout can return (see BoardState.evaluation) - used as the virtual loss
+VIRTUAL_LOSS = 1
+
+
+"""
+Runs one independent search in a worker process.
+@param args is a tuple of (board, turnPlayer, timeout, seed, UCB1ExploreParam)
+@return the root's child statistics, {move code: (n_moves, n_wins)}
+"""
+def rootSearchWorker(args):
+    board, turnPlayer, timeout, seed, UCB1ExploreParam = args
+    random.seed(seed) #every worker needs different random playouts
+    boardState = BoardState(board, turnPlayer)
+    mcts = MonteCarlo(UCB1ExploreParam, verbose=False)
+    mcts.buildTree(boardState, timeout)
+    return mcts.rootStats(boardState)
+
+
+
+"""
+Root-parallel Monte Carlo search (same interface as monteCarlo_with_eval_AI.MonteCarlo)
+"""
+class RootParallelMonteCarlo:
+
+    """
+    Constructor
+    @param numWorkers - how many searches to run at once (defaults to the number of cores)
+    @param UCB1ExploreParam
+    @param verbose - if False, don't print the summary
+    """
+    def __init__(self, numWorkers=None, UCB1ExploreParam=2, verbose=True):
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self.UCB1ExploreParam = UCB1ExploreParam
+        self.verbose = verbose
+        self.stats = {} #merged root statistics from the last search, {move code: [n_moves, n_wins]}
+
+
+    """
+    Runs numWorkers searches from the given state for the allotted time (all at the same time),
+    merges their root statistics, and returns the move with the most visits overall.
+
+    @param state - a BoardState to analyze
+    @param timeout - float seconds; this is how long to run the calculation for.
+    @return - returns a Move object
+    """
+    def runSearch(self, boardState, timeout):
+        #if you can win the game, do it immediately.
+        winMove = boardState.winningMove()
+        if winMove != None:
+            return winMove
+
+        jobs = [(boardState.board, boardState.turnPlayer, timeout, random.getrandbits(32), self.UCB1ExploreParam)
+                for i in range(self.numWorkers)]
+        with multiprocessing.Pool(self.numWorkers) as pool:
+            results = pool.map(rootSearchWorker, jobs)
+
+        #add up the statistics for each root move
+        self.stats = {}
+        for workerStats in results:
+            for moveCode, (n_moves, n_wins) in workerStats.items():
+                merged = self.stats.setdefault(moveCode, [0, 0])
+                merged[0] += n_moves
+                merged[1] += n_wins
+        if not self.stats:
+            return None
+
+        bestCode = max(self.stats, key=lambda moveCode: self.stats[moveCode][0])
+        if self.verbose:
+            print("TOTAL SIMULATIONS:", sum(n_moves for n_moves, n_wins in self.stats.values()), "in", self.numWorkers, "processes")
+            print("THERE ARE THIS MANY MOVES:", len(self.stats))
+        return moveFromCode(bestCode)
+
+
+    """
+    prints the merged statistics of the root's moves (from the last search)
+    """
+    def printTree(self):
+        for moveCode, (n_moves, n_wins) in self.stats.items():
+            print(moveFromCode(moveCode).toString(), "|", "n_moves:", n_moves, "|", "n_wins:", n_wins)
+
+
+
+"""
+Virtual loss: count the nodes on a path (see MonteCarlo.select) as visited once more, and as a loss (see the top of this file).
+removeVirtualLoss undoes it, right before the real result is backpropagated.
+(the root's n_wins is never used, so it's skipped, same as in MonteCarlo.backpropagate)
+"""
+def addVirtualLoss(path):
+    for node in uniqueNodes(path):
+        node.n_moves += 1
+        if node is not path[0]:
+            node.n_wins -= VIRTUAL_LOSS
+
+def removeVirtualLoss(path):
+    for node in uniqueNodes(path):
+        node.n_moves -= 1
+        if node is not path[0]:
+            node.n_wins += VIRTUAL_LOSS
+
+
+"""
+seeds the random playouts differently in every worker process (forked workers start with the same random state)
+"""
+def seedWorker():
+    random.seed(os.getpid() ^ time.time_ns())
+
+"""
+Runs one playout in a worker process.
+@param args is a tuple of (BoardState.toBytes() of the leaf, reverse_eval)
+@return the playout's utility (see MonteCarlo.simulate_better)
+"""
+def playoutWorker(args):
+    data, reverse_eval = args
+    leaf = MonteCarloNode(None, None, boardStateFromBytes(data), [])
+    return MonteCarlo(verbose=False).simulate_better(leaf, reverse_eval)
+
+
+
+"""
+Leaf-parallel Monte Carlo search (same interface as monteCarlo_with_eval_AI.MonteCarlo)
+"""
+class LeafParallelMonteCarlo(MonteCarlo):
+
+    """
+    Constructor
+    @param numWorkers - how many playout processes to run (defaults to the number of cores)
+    @param batchSize - how many leaves to send to the workers at once (defaults to 2 per worker)
+    (the other parameters are the same as MonteCarlo)
+    """
+    def __init__(self, numWorkers=None, batchSize=None, UCB1ExploreParam=2, verbose=True):
+        MonteCarlo.__init__(self, UCB1ExploreParam, verbose=verbose)
+        self.numWorkers = numWorkers or os.cpu_count() or 1
+        self.batchSize = batchSize or 2*self.numWorkers
+
+
+    """
+    selects and expands a batch of leaves (with virtual loss on each one, so they're all different where possible)
+    @return the path to each leaf
+    """
+    def selectBatch(self, boardState):
+        paths = []
+        for i in range(self.batchSize):
+            path = self.select(boardState)
+            node = path[-1]
+            if node.isFullyExpanded() == False and node.boardState.winner() == -1:
+                path.append(self.expand(node))
+            addVirtualLoss(path)
+            paths.append(path)
+        return paths
+
+
+    """
+    Same as MonteCarlo.buildTree, but the playouts run in the worker processes, a batch at a time.
+    @return - the number of simulations run
+    """
+    def buildTree(self, boardState, timeout):
+        reverse_eval = (boardState.turnPlayer == RED_TEAM) #if it's red player, reverse the eval fctn (times -1)
+        self.promoteRoot(boardState)
+        self.makeNode(boardState)
+        end = time.time() + timeout
+        
+        iterations = 0
+        pending = None #the batch the workers are playing out right now: (leaves, async result)
+        with multiprocessing.Pool(self.numWorkers, initializer=seedWorker) as pool:
+            while True:
+                #select the next batch while the workers are busy with the last one
+                batch = None
+                if time.time() < end:
+                    paths = self.selectBatch(boardState)
+                    batch = (paths, pool.map_async(playoutWorker, [(path[-1].boardState.toBytes(), reverse_eval) for path in paths]))
+                
+                #backpropagate the last batch's results
+                if pending:
+                    paths, results = pending
+                    for path, utility in zip(paths, results.get()):
+                        removeVirtualLoss(path)
+                        self.backpropagate(path, utility)
+                    iterations += len(paths)
+                
+                if batch == None:
+                    break
+                pending = batch
+        
+        if self.verbose:
+            print("TOTAL SIMULATIONS:", iterations, "with", self.numWorkers, "playout processes")
+        return iterations
+
+
+
+"""
+Returns True if this Python can run threads in parallel (free-threaded build with the GIL turned off)
+"""
+def isGILDisabled():
+    isGILEnabled = getattr(sys, "_is_gil_enabled", None) #only exists in python 3.13+
+    return isGILEnabled != None and not isGILEnabled()
+
+
+"""
+Tree-parallel Monte Carlo search (same interface as monteCarlo_with_eval_AI.MonteCarlo).
+- one lock protects the tree: selection, expansion and backpropagation happen while holding it
+- the playouts (the expensive part) run without the lock, on each thread's own copy of the leaf's 
+  BoardState, so the BoardStates in the tree are never changed once they're in a node
+"""
+class TreeParallelMonteCarlo(MonteCarlo):
+
+    """
+    Constructor
+    @param numThreads - how many search threads (defaults to the number of cores). 
+        Only 1 is used if the GIL is on, since more threads would just take turns.
+    (the other parameters are the same as MonteCarlo)
+    """
+    def __init__(self, numThreads=None, UCB1ExploreParam=2, verbose=True):
+        MonteCarlo.__init__(self, UCB1ExploreParam, verbose=verbose)
+        self.numThreads = numThreads or os.cpu_count() or 1
+        if not isGILDisabled():
+            self.numThreads = 1
+        self.lock = threading.Lock()
+
+
+    """
+    Same as MonteCarlo.buildTree, but runs searchThread in numThreads threads.
+    @return - the number of simulations run
+    """
+    def buildTree(self, boardState, timeout):
+        reverse_eval = (boardState.turnPlayer == RED_TEAM) #if it's red player, reverse the eval fctn (times -1)
+        self.promoteRoot(boardState)
+        self.makeNode(boardState)
+        end = time.time() + timeout
+        
+        iterations = [0] * self.numThreads #simulations run by each thread
+        if self.numThreads == 1:
+            self.searchThread(boardState, end, reverse_eval, iterations, 0)
+        else:
+            threads = [threading.Thread(target=self.searchThread, args=(boardState, end, reverse_eval, iterations, i)) 
+                       for i in range(self.numThreads)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+        
+        if self.verbose:
+            print("TOTAL SIMULATIONS:", sum(iterations), "in", self.numThreads, "threads")
+        return sum(iterations)
+
+
+    """
+    One search thread: repeats select/expand (locked), playout (not locked), backpropagate (locked) until time's up.
+    """
+    def searchThread(self, boardState, end, reverse_eval, iterations, threadNum):
+        while (time.time() < end):
+            with self.lock:
+                path = self.select(boardState)
+                node = path[-1]
+                if node.isFullyExpanded() == False and node.boardState.winner() == -1:
+                    node = self.expand(node)
+                    path.append(node)
+                addVirtualLoss(path)
+                #a private copy of the leaf's state for the playout (the copy shares what it doesn't change - see BoardState.shareAll)
+                leafState = node.boardState
+                playoutState = BoardState(leafState.board, leafState.turnPlayer, oldState=leafState)
+            
+            utility = self.simulate_better(MonteCarloNode(None, None, playoutState, []), reverse_eval)
+            
+            with self.lock:
+                removeVirtualLoss(path)
+                self.backpropagate(path, utility)
+            iterations[threadNum] += 1
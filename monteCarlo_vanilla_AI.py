@@ -48,9 +48,12 @@ class MonteCarlo:
     Constructor
     @param game -  the current Game object
     @param UCB1ExploreParam
+    @param inPlacePlayouts - if True, simulations make/unmake moves on the node's own BoardState
+        instead of copying a new BoardState every move (much faster; the state is restored afterwards)
     """
-    def __init__(self, UCB1ExploreParam=2):
+    def __init__(self, UCB1ExploreParam=2, inPlacePlayouts=True):
         self.UCB1ExploreParam = UCB1ExploreParam
+        self.inPlacePlayouts = inPlacePlayouts
         self.nodes = {} #this is the tree
         
     
@@ -205,8 +208,8 @@ class MonteCarlo:
     Phase 2, Expansion: Expand a random unexpanded child node of given node
     """
     def expand(self, node):
-        #pick random move
-        move = random.choice( node.unexpandedMoves() )
+        #pick random move (the untried moves are already shuffled)
+        move = node.untriedMoves.pop()
         
         #expand (i.e. perform the move and get the available moves from the new state)
         childState = node.boardState.nextState(move)
@@ -230,12 +233,18 @@ class MonteCarlo:
             moves = boardState.getAllMoves_Limited()
             if len(moves)==0: break  #a comment in the reference article said to put this here
             move = random.choice(moves)
-            boardState = boardState.nextState(move)
+            if self.inPlacePlayouts: 
+                boardState.makeMove(move) #undone at the end
+            else:
+                boardState = boardState.nextState(move)
             winner = boardState.winner()
             moveCount+=1
             #stop simulation if it goes on too long... like, why look 50 moves deep when humans only think like 5 deep?
-            if moveCount > 20: return 0
+            if moveCount > 20: 
+                winner = 0
+                break
         print(moveCount)
+        self.undoPlayout(boardState, moveCount)
         return winner
 
         
@@ -252,27 +261,41 @@ class MonteCarlo:
         winner = boardState.winner()
         count = 0
         while winner == -1:
-            allMoves = boardState.getAllMoves_Limited()
-            if not allMoves: break #if no available moves, break. Idk if this is necessary
-            
             #if there's a capture available, take it (for simulation purposes)
-            captureMoves = [m for m in allMoves if m.isCapture]
+            #(check for captures first: it's way cheaper than generating all the moves)
+            captureMoves = boardState.getCaptureMoves()
             if captureMoves:
                 move = random.choice(captureMoves)
             #otherwise, just pick a random move
             else:
+                allMoves = boardState.getAllMoves_Limited()
+                if not allMoves: break #if no available moves, break. Idk if this is necessary
                 move = random.choice(allMoves)
             
             #perform the move and check for game over
-            boardState = boardState.nextState(move)
+            if self.inPlacePlayouts: 
+                boardState.makeMove(move) #undone at the end
+            else:
+                boardState = boardState.nextState(move)
             winner = boardState.winner()
             
             #don't simulate past 40 moves... most games don't go past 30 moves total
             count+=1
             if count > 40: 
-                return 0
+                winner = 0
+                break
+        self.undoPlayout(boardState, count)
         return winner
     
+    """
+    After an in-place playout, unmake its moves so the node's BoardState is back to normal.
+    (does nothing if the playout made new BoardStates instead)
+    """
+    def undoPlayout(self, boardState, moveCount):
+        if self.inPlacePlayouts:
+            for i in range(moveCount):
+                boardState.unmakeMove()
+    
     """
     Phase 4, Backpropagation: Update ancestor statistics with win/loss data.
     @param node is a new leaf node that you just simulated
@@ -308,7 +331,7 @@ Source: https://github.com/quasimik/medium-mcts/blob/master/monte-carlo-node.js
 """
 class MonteCarloNode:
     
-    __slots__ = ["move", "boardState", "n_moves", "n_wins", "parent", "children"]
+    __slots__ = ["move", "boardState", "n_moves", "n_wins", "parent", "children", "untriedMoves", "n_expanded"]
     
     
     """
@@ -332,6 +355,12 @@ class MonteCarloNode:
         #from their hashes.
         self.children = {m.hashThis(): { "move": m, "node": None } for m in unexpandedMoves}
         
+        #the moves that haven't been expanded yet, in random order (so expanding a random one is just a pop),
+        #and how many children have been expanded (so checking if this node is fully expanded is just comparing 2 ints)
+        self.untriedMoves = [child["move"] for child in self.children.values()]
+        random.shuffle(self.untriedMoves)
+        self.n_expanded = 0
+        
         
     """
     Get the MonteCarloNode corresponding to the given move.
@@ -363,6 +392,7 @@ class MonteCarloNode:
             raise Exception("No such move!")
         childNode = MonteCarloNode(self, move, childState, unexpandedMoves)
         self.children[moveKey] = { "move": move, "node": childNode }
+        self.n_expanded += 1
         return childNode
     
 
@@ -375,11 +405,11 @@ class MonteCarloNode:
 
 
     """
-    Get all unexpanded legal Moves from this node (search children for "None" nodes).
+    Get all unexpanded legal Moves from this node (in the random order they'll be expanded in).
     @return list of Moves
     """
     def unexpandedMoves(self):
-        return [child["move"] for child in self.children.values() if child["node"] == None]
+        return list(self.untriedMoves)
 
 
     """
@@ -393,12 +423,10 @@ class MonteCarloNode:
     """
     True if this node is fully expanded. 
     AKA have you visited each child?
-    (search children for "None" nodes -> true if none found).
+    (compares the number of expanded children to the number of children).
     """
     def isFullyExpanded(self):
-        for child in self.children.values():
-            if child["node"] == None: return False
-        return True
+        return self.n_expanded == len(self.children)
 
         
     """
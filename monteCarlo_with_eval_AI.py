@@ -30,11 +30,18 @@ References:
 ^had to convert this from javascript and modify it heavily
 
 -Why you discard the tree each time: https://stackoverflow.com/questions/47389700/why-does-monte-carlo-tree-search-reset-tree
+^(you don't have to discard all of it: keep the same MonteCarlo object between turns, 
+and the next search starts from the subtree it already built for that position - see promoteRoot)
 
 -Possible memory issues: http://orangehelicopter.com/academic/papers/powley_aiide17.pdf
 
 -MCTS with Evaluation Function: https://www.sciencedirect.com/science/article/pii/S0304397516302717
 
+-Transpositions: "Transpositions and Move Groups in Monte Carlo Tree Search" (Childs, Brodeur, Kocsis, 2008)
+^the same position can be reached by different orders of moves (placements especially), so the tree is really
+a graph: a position only gets one node, shared by every move that leads to it (see MonteCarlo.expand)
+^with symmetricNodes, mirror images of a position share the node too (see PaiShoEngine.SYMMETRIES)
+
 """
 
 
@@ -52,10 +59,21 @@ import math
 import time
 import random
 from constants2 import RED_TEAM
+from PaiShoEngine import BoardState, moveFromCode, transformMove, SYMMETRY_PRODUCTS, SYMMETRY_INVERSES
 
 #how deep into the game tree do you search? Recommended: 4-6
 SIMULATION_DEPTH_CUTOFF = 5 
 
+#rough memory use of a node (measured with tracemalloc), for the maxBytes budget: 
+#its BoardState, plus a little for each of its moves (in its untried moves, or its children dict once expanded)
+NODE_BYTES = 17000
+CHILD_BYTES = 8
+#a node without a BoardState (see leanNodes) is just the node object and its stats
+LEAN_NODE_BYTES = 1000
+
+#when the tree goes over budget, prune it down to this fraction of the budget (so it doesn't have to prune every iteration)
+PRUNE_TO = 0.9
+
 
 # =============================================================================
 # TREE
@@ -70,42 +88,160 @@ class MonteCarlo:
     Constructor
     @param game -  the current Game object
     @param UCB1ExploreParam
-    """
-    def __init__(self, UCB1ExploreParam=2):
+    @param inPlacePlayouts - if True, simulations make/unmake moves on the node's own BoardState
+        instead of copying a new BoardState every move (much faster; the state is restored afterwards)
+    @param verbose - if False, don't print progress (like when running in a worker process)
+    @param maxNodes - if given, the most nodes the tree can have. When there are more, the least-visited 
+        subtrees are pruned (see pruneTree), so long searches run in a fixed amount of memory.
+        The root and its children are never pruned, so if there are more of them than this, they're the limit instead.
+    @param maxBytes - same thing, but as a rough number of bytes (see NODE_BYTES)
+    @param leanNodes - if True, the nodes below the root don't keep a BoardState, just their move and stats.
+        Each iteration replays the moves from the root on one scratch BoardState (makeMove) 
+        and unmakes them at the end. A few more make/unmakes per iteration, but a much smaller tree.
+    @param symmetricNodes - if True, nodes are keyed by the position's canonical key (see BoardState.canonicalKey),
+        so a position and its rotations/reflections share one node and its statistics.
+        A node's moves are in the orientation of the state that made it (see MonteCarloNode.symmetry).
+    """
+    def __init__(self, UCB1ExploreParam=2, inPlacePlayouts=True, verbose=True, maxNodes=None, maxBytes=None, leanNodes=False, 
+                 symmetricNodes=False):
         self.UCB1ExploreParam = UCB1ExploreParam
-        self.nodes = {} #this is the tree
+        self.inPlacePlayouts = inPlacePlayouts
+        self.verbose = verbose
+        self.maxNodes = maxNodes
+        self.maxBytes = maxBytes
+        self.leanNodes = leanNodes
+        self.symmetricNodes = symmetricNodes
+        self.nodes = {} #this is the tree (one node per position - see expand)
+        self.root = None #the node of the position being searched
+        self.rootPlayer = None #the player the tree's statistics are for (the turn player of the last search)
+        self.treeBytes = 0 #rough memory use of all the nodes (see nodeBytes)
+        self.scratchState = None #leanNodes: the state of the node the current iteration is at
+        self.scratchDepth = 0    #leanNodes: how many moves were made on scratchState this iteration
+        self.scratchSymmetry = 0 #leanNodes + symmetricNodes: turns the current node's moves into scratchState's orientation
         
     
     """
     prints the first level of the tree (all moves available from given boardState)
     """
     def printTree(self, boardState):
-        boardHash = boardState.hashThis()
+        boardHash = self.positionKey(boardState)[0]
         if boardHash in self.nodes:
             rootNode = self.nodes[boardHash]
-            for moveHash in rootNode.children:
-                data = rootNode.children[moveHash]
-                move = data['move']
-                n_moves = data['node'].n_moves
-                n_wins = data['node'].n_wins
-                print(move.toString(), "|", "n_moves:", n_moves, "|", "n_wins:", n_wins)
+            symmetry = self.relativeSymmetry(rootNode, boardState)
+            for moveHash, childNode in rootNode.children.items():
+                move = transformMove(moveFromCode(moveHash), symmetry)
+                print(move.toString(), "|", "n_moves:", childNode.n_moves, "|", "n_wins:", childNode.n_wins)
+    
+    
+    """
+    Returns (the key of a position's node in self.nodes, the position's transform to its canonical version).
+    That's the zobrist key (and no transform), or with symmetricNodes, the canonical key (see BoardState.canonicalKey).
+    """
+    def positionKey(self, boardState):
+        if self.symmetricNodes:
+            return boardState.canonicalKey()
+        return boardState.hashThis(), 0
+    
+    
+    """
+    symmetricNodes: returns the transform that turns the given node's moves into moves for the given state
+    (the node can have been made by a rotated/reflected version of the state). Always 0 without symmetricNodes.
+    """
+    def relativeSymmetry(self, node, boardState):
+        if not self.symmetricNodes:
+            return 0
+        #node's orientation -> canonical -> boardState's orientation
+        return SYMMETRY_PRODUCTS[SYMMETRY_INVERSES[boardState.canonicalKey()[1]]][node.symmetry]
+    
+    
+    """
+    Tree reuse: if the given state is already in the tree (like after your move and the opponent's reply,
+    when the previous search already looked at that position), make its node the new root and 
+    throw away everything that isn't under it. Otherwise throw away the whole tree.
+    -->the next search keeps all the statistics the last one gathered for this position.
+    The statistics are from the point of view of the player who was searching (see reverse_eval in buildTree), 
+    so if it's the other player searching now, the whole tree is thrown away too.
+    """
+    def promoteRoot(self, boardState):
+        newRoot = self.nodes.get(self.positionKey(boardState)[0])
+        if boardState.turnPlayer != self.rootPlayer:
+            newRoot = None
+        self.rootPlayer = boardState.turnPlayer
+        self.nodes = {}
+        self.treeBytes = 0
+        if newRoot is None:
+            return
+        #only keep the nodes in the new root's subtree
+        for node in subtreeNodes(newRoot):
+            self.nodes[node.hashKey] = node
+        #forget the links from the nodes that were thrown away (like the new root's old parent)
+        for node in self.nodes.values():
+            node.parents = [(parent, move) for parent, move in node.parents if self.nodes.get(parent.hashKey) is parent]
+        self.treeBytes = sum(nodeBytes(node) for node in self.nodes.values())
+        if self.verbose:
+            print("REUSING", newRoot.n_moves, "SIMULATIONS FROM THE LAST SEARCH")
     
     
     """
     If given state does not exist, create dangling node of that state.
+    Either way, that node is the root of the search now (self.root).
     """
     def makeNode(self, boardState):
-        boardHash = boardState.hashThis()
+        boardHash, symmetry = self.positionKey(boardState)
         if boardHash not in self.nodes.keys():
             unexpandedMoves = boardState.getAllMoves_Limited() #shallow-copy all moves from this state
-            node = MonteCarloNode(None, None, boardState, unexpandedMoves)
+            node = MonteCarloNode(None, None, boardState, unexpandedMoves, boardHash, symmetry)
             self.nodes[boardHash] = node
+            self.treeBytes += nodeBytes(node)
+        self.root = self.nodes[boardHash]
+            
+    
+    """
+    Returns the BoardState of a node: its own, or (with leanNodes) the scratch state, 
+    which is at that node's position during the iteration that reached it.
+    """
+    def nodeState(self, node):
+        if self.leanNodes:
+            return self.scratchState
+        return node.boardState
+    
+    
+    """
+    leanNodes: plays a move on the scratch state (undone by resetScratch at the end of the iteration)
+    """
+    def makeScratchMove(self, move):
+        self.scratchState.makeMove(move)
+        self.scratchDepth += 1
+    
+    """
+    leanNodes: unmakes this iteration's moves, so the scratch state is back at the root
+    """
+    def resetScratch(self):
+        for i in range(self.scratchDepth):
+            self.scratchState.unmakeMove()
+        self.scratchDepth = 0
             
  
     
     """
-    From given state, repeatedly run MCTS for the allotted time
-    build the statistics tree, then return the 'best' move.
+    From given state, run MCTS for the allotted time (see buildTree), then return the 'best' move.
+    
+    @param state - a BoardState to analyze
+    @param timeout - float seconds; this is how long to run the calculation for.
+    @return - returns a Move object
+    """
+    def runSearch(self, boardState, timeout):
+        #if you can win the game, do it immediately.
+        winMove = boardState.winningMove()
+        if winMove != None: 
+            return winMove
+        
+        self.buildTree(boardState, timeout)
+        return self.bestMove(boardState)
+    
+    
+    """
+    From given state, repeatedly run MCTS for the allotted time to build the statistics tree.
     
     4-Phase Algorithm:
     In phase (1), existing information is used to repeatedly choose 
@@ -117,17 +253,18 @@ class MonteCarlo:
         
     @param state - a BoardState to analyze
     @param timeout - float seconds; this is how long to run the calculation for.
-    @return - returns a Move object
+    @return - the number of simulations run
     """
-    def runSearch(self, boardState, timeout):
+    def buildTree(self, boardState, timeout):
         reverse_eval = (boardState.turnPlayer == RED_TEAM) #if it's red player, reverse the eval fctn (times -1)
-            
-        #if you can win the game, do it immediately.
-        winMove = boardState.winningMove()
-        if winMove != None: 
-            return winMove
         
+        self.promoteRoot(boardState) #keep what the last search found out about this position (if anything)
         self.makeNode(boardState)    #makes root of the tree
+        if self.leanNodes:
+            #a copy of the root state to play the moves on (the copy shares what it doesn't change - see BoardState.shareAll)
+            self.scratchState = BoardState(boardState.board, boardState.turnPlayer, oldState=boardState)
+            self.scratchDepth = 0
+            self.scratchSymmetry = 0
         end = time.time() + timeout  #time.time() returns float representing elapsed seconds since epoch
         
         iterations = 0
@@ -137,27 +274,37 @@ class MonteCarlo:
             iterations += 1
             
             #1. Selection: find the next node to look at (unexpanded or leaf, chosen by UCB1 heuristic)
-            node = self.select(boardState)
+            path = self.select(boardState)
+            node = path[-1]
             
-            winner = node.boardState.winner()
-            if node.isLeaf() == False and winner == -1:   #-1 means no winner yet 
+            winner = self.nodeState(node).winner()
+            if node.isFullyExpanded() == False and winner == -1:   #-1 means no winner yet 
                 #2. Expansion: Expand a random unexpanded child node of given node
                 node = self.expand(node)
+                path.append(node)
                 
-                #3. Simulation: Play game to terminal state (randomly), return winner
-                #winner = self.simulate(node)
-                # winner = self.simulate_better(node)
-                utility = self.simulate_better(node, reverse_eval) #TODO
+            #3. Simulation: Play game to terminal state (randomly), return winner
+            #winner = self.simulate(node)
+            # winner = self.simulate_better(node)
+            utility = self.simulate_better(node, reverse_eval) #TODO
                 
-            #4. Backpropagation: Update ancestor statistics
-            self.backpropagate(node, utility)
+            #4. Backpropagation: Update the statistics of the nodes on the path
+            self.backpropagate(path, utility)
+            
+            if self.leanNodes:
+                self.resetScratch()
+            
+            #keep the tree inside its memory budget
+            if self.isOverBudget():
+                self.pruneTree()
             
             #output for debugging
-            if iterations % 200 ==0: 
+            if self.verbose and iterations % 200 ==0: 
                 print(iterations, "simulations")
         
-        print("TOTAL SIMULATIONS:", iterations)
-        return self.bestMove(boardState)           
+        if self.verbose:
+            print("TOTAL SIMULATIONS:", iterations)
+        return iterations
             
 
 
@@ -176,7 +323,7 @@ class MonteCarlo:
         # aka, you haven't checked all of the available moves at least once
         # this might just mean you have to run the search for longer
         # --> or, if it just takes too long, then maybe change this to pick from best options
-        rootNode = self.nodes[boardState.hashThis()]
+        rootNode = self.nodes[self.positionKey(boardState)[0]]
         if not rootNode.isFullyExpanded():
             raise Exception("Not enough information!! Root not fully expanded! Might need longer runtime.") 
             #instead of raising an exception, maybe pick the best move from the available options?
@@ -185,17 +332,30 @@ class MonteCarlo:
         allMoves = rootNode.allMoves()
         bestMove = None
         maxN = -math.inf
-        print("THERE ARE THIS MANY MOVES:", len(allMoves))
+        if self.verbose:
+            print("THERE ARE THIS MANY MOVES:", len(allMoves))
         #loop over all moves and return the one with the highest n_moves
         for move in allMoves:
             childNode = rootNode.childNode(move)
             if childNode.n_moves > maxN: 
                 bestMove = move
                 maxN = childNode.n_moves
-        return bestMove
+        #(the root node might have been made by a rotated/reflected version of boardState - see symmetricNodes)
+        return transformMove(bestMove, self.relativeSymmetry(rootNode, boardState))
         
     
     
+    """
+    Returns the statistics of the root's expanded children, as a dict of {move code: (n_moves, n_wins)}
+    (move codes instead of Moves so they're cheap to send between processes - see monteCarlo_parallel_AI)
+    """
+    def rootStats(self, boardState):
+        rootNode = self.nodes[self.positionKey(boardState)[0]]
+        symmetry = self.relativeSymmetry(rootNode, boardState)
+        return {transformMove(moveFromCode(moveKey), symmetry).code: (childNode.n_moves, childNode.n_wins) 
+                for moveKey, childNode in rootNode.children.items()}
+    
+    
     """
     Get the best n moves from the stats tree
     """
@@ -207,38 +367,141 @@ class MonteCarlo:
 
     """
     Phase 1, Selection: Select until you find a node not fully expanded OR leaf
+    (with leanNodes, also plays each chosen move on the scratch state)
+    If the selection gets back to a position that's already on the path (the position repeated), it stops there.
+    (otherwise it could go around the cycle forever)
+    
+    @return the path: the list of nodes from the root to the selected node 
+        (a node can have more than one parent, so this is the only way to know how it got there)
     """
     def select(self, boardState):
-        node = self.nodes[boardState.hashThis()]
+        node = self.nodes[self.positionKey(boardState)[0]]
+        path = [node]
+        if self.leanNodes:
+            self.scratchSymmetry = self.relativeSymmetry(node, self.scratchState)
         
         while node.isFullyExpanded() and not node.isLeaf():
             moves = node.allMoves()
             bestMove = None
             bestUCB1 = -math.inf
             for move in moves:
-                childUCB1 = node.childNode(move).getUCB1(self.UCB1ExploreParam)
+                childUCB1 = node.childNode(move).getUCB1(self.UCB1ExploreParam, node.n_moves)
                 if childUCB1 > bestUCB1:
                     bestMove = move
                     bestUCB1 = childUCB1
             node = node.childNode(bestMove)
-        #return an unexpanded node
-        return node
+            if self.leanNodes:
+                self.makeScratchMove(transformMove(bestMove, self.scratchSymmetry))
+                self.scratchSymmetry = self.relativeSymmetry(node, self.scratchState)
+            repeated = node in path
+            path.append(node)
+            if repeated:
+                break
+        #return the path to an unexpanded node
+        return path
 
         
     
     """
     Phase 2, Expansion: Expand a random unexpanded child node of given node
+    If the new position is already in the tree (a transposition: a different order of moves got there first), 
+    the move just links to that node, so both paths share its statistics.
     """
     def expand(self, node):
-        #pick random move
-        move = random.choice( node.unexpandedMoves() )
+        #pick random move (the untried moves are already shuffled)
+        move = node.untriedMoves.pop()
+        
+        #perform the move
+        if self.leanNodes:
+            self.makeScratchMove(transformMove(move, self.scratchSymmetry))
+            childState = self.scratchState
+        else:
+            childState = node.boardState.nextState(move)
+        
+        #transposition: link to the existing node
+        childKey, childSymmetry = self.positionKey(childState)
+        existingNode = self.nodes.get(childKey)
+        if existingNode != None:
+            node.link(move, existingNode)
+            return existingNode
         
-        #expand (i.e. perform the move and get the available moves from the new state)
-        childState = node.boardState.nextState(move)
+        #expand (i.e. get the available moves from the new state)
         childUnexpandedMoves = childState.getAllMoves_Limited()
-        childNode = node.expand(move, childState, childUnexpandedMoves)
-        self.nodes[childState.hashThis()] = childNode
+        if self.leanNodes:
+            #the child only gets the move and the position's hash, not the state
+            childNode = node.expand(move, None, childUnexpandedMoves, childKey, childSymmetry)
+        else:
+            childNode = node.expand(move, childState, childUnexpandedMoves, childKey, childSymmetry)
+        self.nodes[childNode.hashKey] = childNode
+        self.treeBytes += nodeBytes(childNode)
         return childNode
+    
+    
+    """
+    True if the tree has more nodes (or bytes) than it's allowed to
+    (the budget is never less than the root and its children, since pruneTree can't remove those)
+    @param fraction - compare to this fraction of the budget instead
+    """
+    def isOverBudget(self, fraction=1):
+        overNodes = self.maxNodes != None and len(self.nodes) > self.maxNodes * fraction
+        overBytes = self.maxBytes != None and self.treeBytes > self.maxBytes * fraction
+        if not (overNodes or overBytes):
+            return False
+        minNodes, minBytes = self.unprunableSize()
+        return ((overNodes and len(self.nodes) > minNodes) 
+                or (overBytes and self.treeBytes > minBytes))
+    
+    
+    """
+    returns (number of nodes, bytes) of the part of the tree pruneTree never removes: the root and its children
+    (all of the root's moves count as nodes, since they'll all be expanded eventually)
+    """
+    def unprunableSize(self):
+        root = self.root
+        rootChildren = set(root.children.values())
+        rootChildren.discard(root)
+        return (1 + len(root.children) + len(root.untriedMoves), 
+                nodeBytes(root) + sum(nodeBytes(child) for child in rootChildren))
+    
+    
+    """
+    Memory budget: prunes the least-visited subtrees until the tree is back under PRUNE_TO of its budget.
+    A pruned node goes back to being an unexpanded child of its parents (its move goes back into each parent's 
+    untried moves), so the search can expand it again later if it turns out to matter.
+    The root's children are never pruned, since bestMove needs their statistics (so they aren't part of the budget - see isOverBudget).
+    """
+    def pruneTree(self):
+        root = self.root
+        candidates = [node for node in self.nodes.values() 
+                      if node is not root and not any(parent is root for parent, move in node.parents)]
+        candidates.sort(key=lambda node: node.n_moves)
+        for node in candidates:
+            if not self.isOverBudget(PRUNE_TO):
+                break
+            #skip nodes that were already removed along with a pruned ancestor
+            if self.nodes.get(node.hashKey) is not node:
+                continue
+            for parent, move in list(node.parents):
+                parent.unexpand(move)
+            self.removeNode(node)
+    
+    
+    """
+    Removes a node that no other node links to anymore, and then each of its descendants that 
+    no other node links to either (descendants that are still linked from somewhere else stay).
+    """
+    def removeNode(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.nodes.get(node.hashKey) is not node:
+                continue
+            del self.nodes[node.hashKey]
+            self.treeBytes -= nodeBytes(node)
+            for childNode in node.children.values():
+                childNode.parents = [(parent, move) for parent, move in childNode.parents if parent is not node]
+                if not childNode.parents and childNode is not self.root:
+                    stack.append(childNode)
 
 
         
@@ -248,19 +511,26 @@ class MonteCarlo:
     Phase 3, Simulation: Play game to terminal state (randomly)
     """
     def simulate_random(self, node, depth_cutoff=SIMULATION_DEPTH_CUTOFF):
-        boardState = node.boardState
+        boardState = self.nodeState(node)
         winner = boardState.winner()
         moveCount = 0
         while winner == -1:
             moves = boardState.getAllMoves_Limited()
             if len(moves)==0: break  #a comment in the reference article said to put this here
             move = random.choice(moves)
-            boardState = boardState.nextState(move)
+            if self.inPlacePlayouts: 
+                boardState.makeMove(move) #undone at the end
+            else:
+                boardState = boardState.nextState(move)
             winner = boardState.winner()
             moveCount+=1
             #stop simulation if it goes on too long... like, why look 50 moves deep when humans only think like 5 deep?
-            if moveCount > depth_cutoff: return 0
-        print(moveCount)
+            if moveCount > depth_cutoff: 
+                winner = 0
+                break
+        if self.verbose:
+            print(moveCount)
+        self.undoPlayout(boardState, moveCount)
         return winner
 
         
@@ -273,51 +543,65 @@ class MonteCarlo:
     @return winner is 1 if white wins, 2 if red, or 0 if no winner.
     """
     def simulate_better(self, node, reverse_eval, depth_cutoff=SIMULATION_DEPTH_CUTOFF):
-        boardState = node.boardState
+        boardState = self.nodeState(node)
         winner = boardState.winner()
         count = 0
         while winner == -1:
-            allMoves = boardState.getAllMoves_Limited()
-            if not allMoves: break #if no available moves, break. Idk if this is necessary
-            
             #if there's a capture available, take it (for simulation purposes)
-            captureMoves = [m for m in allMoves if m.isCapture]
-            if len(captureMoves) >0:
+            #(check for captures first: it's way cheaper than generating all the moves)
+            captureMoves = boardState.getCaptureMoves()
+            if captureMoves:
                 move = random.choice(captureMoves)
             #otherwise, just pick a random move
             else:
+                allMoves = boardState.getAllMoves_Limited()
+                if not allMoves: break #if no available moves, break. Idk if this is necessary
                 move = random.choice(allMoves)
             
             #perform the move and check for game over
-            boardState = boardState.nextState(move)
+            if self.inPlacePlayouts: 
+                boardState.makeMove(move) #undone at the end
+            else:
+                boardState = boardState.nextState(move)
             winner = boardState.winner()
             
             #don't simulate past 10 moves... most games don't go past 30 moves total
             count+=1
             if count > depth_cutoff: 
                 break
-        #return the evaluation score - but reverse the sign if red player is calculating
+        #get the evaluation score - but reverse the sign if red player is calculating
         if reverse_eval:
-            return -1 * boardState.evaluation()
+            utility = -1 * boardState.evaluation()
         else:
-            return boardState.evaluation()
+            utility = boardState.evaluation()
+        self.undoPlayout(boardState, count)
+        return utility
+    
+    """
+    After an in-place playout, unmake its moves so the node's BoardState is back to normal.
+    (does nothing if the playout made new BoardStates instead)
+    """
+    def undoPlayout(self, boardState, moveCount):
+        if self.inPlacePlayouts:
+            for i in range(moveCount):
+                boardState.unmakeMove()
     
     """
     Phase 4, Backpropagation: Update ancestor statistics with win/loss data.
-    @param node is a new leaf node that you just simulated
+    Follows the path the iteration actually took (see select), not the nodes' parents, since 
+    a node can have more than one parent. A node that's on the path twice is only updated once.
+    @param path is the list of nodes from the root to the new leaf node that you just simulated
     @return nothing; just updates the tree.
     """
-    def backpropagate(self, node, utility):
-        while node != None:
+    def backpropagate(self, path, utility):
+        root = path[0]
+        for node in uniqueNodes(path):
             node.n_moves += 1
-            #Parent's choice
-            if node.parent == None: return
+            #Parent's choice (the root's n_wins is never used)
+            if node is root: continue
             
             #instead of win count, backpropagate the resulting board evaluation
             node.n_wins += utility
-                
-            #move upward in the tree for next iteration
-            node = node.parent
 
     
     
@@ -331,29 +615,42 @@ Source: https://github.com/quasimik/medium-mcts/blob/master/monte-carlo-node.js
 """
 class MonteCarloNode:
     
-    __slots__ = ["move", "boardState", "n_moves", "n_wins", "parent", "children"]
+    __slots__ = ["boardState", "hashKey", "symmetry", "n_moves", "n_wins", "parents", "children", "untriedMoves"]
     
     
     """
-    @param parent - the parent MonteCarloNode
+    @param parent - the parent MonteCarloNode (None for a root)
     @param move - the Move made from the parent to get to this node
-    @param boardState - the BoardState associated with this node
+    @param boardState - the BoardState associated with this node (None for lean nodes - see MonteCarlo.leanNodes)
     @param unexpandedMvoes - a list of legal Moves that can be made from this node
+    @param hashKey - the hash of this node's position (only needed if there's no boardState to get it from)
+    @param symmetry - the transform that turns this node's position (and its moves) into the canonical version
+        (only used with MonteCarlo.symmetricNodes - see BoardState.canonicalKey)
     """
-    def __init__(self, parent, move, boardState, unexpandedMoves):
-        self.move = move
+    def __init__(self, parent, move, boardState, unexpandedMoves, hashKey=None, symmetry=0):
         self.boardState = boardState
+        self.hashKey = boardState.hashThis() if hashKey == None else hashKey #the key of this node in MonteCarlo.nodes
+        self.symmetry = symmetry
         # Stats to keep track of after simulations
         self.n_moves = 0
         self.n_wins = 0
         # Tree stuff
-        self.parent = parent
+        #the nodes that link to this one, and with which Move, as a list of (parent, move) tuples.
+        #(more than one if this position was reached by different orders of moves - see MonteCarlo.expand)
+        self.parents = []
+        
+        #MonteCarloNode.children is a map from Move hashes to the expanded child nodes.
+        #(the Move object for a hash is PaiShoEngine.moveFromCode(hash))
+        self.children = {}
         
-        #MonteCarloNode.children is a map from Move hashes to a dict
-        #containing (1) the Move object and (2) the associated child node. 
-        #It includes the Move object here for convenient recovery of Move objects 
-        #from their hashes.
-        self.children = {m.hashThis(): { "move": m, "node": None } for m in unexpandedMoves}
+        #the moves that haven't been expanded yet, in random order (so expanding a random one is just a pop).
+        #Moves are shared objects (see PaiShoEngine.getMove), so this is just a list of pointers:
+        #an unexpanded child doesn't cost anything else until it's expanded.
+        self.untriedMoves = list(unexpandedMoves)
+        random.shuffle(self.untriedMoves)
+        
+        if parent != None:
+            parent.link(move, self)
         
         
     """
@@ -363,30 +660,45 @@ class MonteCarloNode:
     @return {MonteCarloNode} The child node corresponding to the Move given.
     """
     def childNode(self, move):
-        moveKey = move.hashThis()
-        if moveKey not in self.children:
-            raise Exception("No such move!") 
-        child = self.children[moveKey]
-        if (child["node"] == None):
+        childNode = self.children.get(move.hashThis())
+        if childNode == None:
             raise Exception("Child is not expanded!")
-        return child["node"]
+        return childNode
 
     
     """
     Expand the specified child move and return the new child node.
-    Specifically, it replaces null (unexpanded) nodes in MonteCarloNode.children with real nodes.
+    Specifically, it adds the new node to MonteCarloNode.children.
     
     Expand the specified child's move and return the new child node.
     Add the node to the array of children nodes.
     Remove the play from the array of unexpanded plays.
     """
-    def expand(self, move, childState, unexpandedMoves):
+    def expand(self, move, childState, unexpandedMoves, hashKey=None, symmetry=0):
+        return MonteCarloNode(self, move, childState, unexpandedMoves, hashKey, symmetry)
+    
+    
+    """
+    Makes the given node the child for the given move (used by expand, and for transpositions: 
+    when the move leads to a position that already has a node)
+    """
+    def link(self, move, childNode):
         moveKey = move.hashThis()
-        if not moveKey in self.children.keys():
-            raise Exception("No such move!")
-        childNode = MonteCarloNode(self, move, childState, unexpandedMoves)
-        self.children[moveKey] = { "move": move, "node": childNode }
-        return childNode
+        if moveKey in self.children:
+            raise Exception("Child is already expanded!")
+        self.children[moveKey] = childNode
+        childNode.parents.append((self, move))
+    
+
+    """
+    Undo expand: turns the given move's child back into an unexpanded child (used to prune the tree).
+    The move goes back into the untried moves at a random spot, so they stay in random order.
+    """
+    def unexpand(self, move):
+        childNode = self.children.pop(move.hashThis())
+        childNode.parents = [(parent, parentMove) for parent, parentMove in childNode.parents 
+                             if parent is not self or parentMove is not move]
+        self.untriedMoves.insert(random.randint(0, len(self.untriedMoves)), move)
     
 
     """
@@ -394,34 +706,32 @@ class MonteCarloNode:
     @return an array of Moves
     """
     def allMoves(self): 
-        return [child["move"] for child in self.children.values()]
+        return self.expandedMoves() + self.untriedMoves
 
 
     """
-    Get all unexpanded legal Moves from this node (search children for "None" nodes).
+    Get all unexpanded legal Moves from this node (in the random order they'll be expanded in).
     @return list of Moves
     """
     def unexpandedMoves(self):
-        return [child["move"] for child in self.children.values() if child["node"] == None]
+        return list(self.untriedMoves)
 
 
     """
-    Get all expanded legal Moves from this node (search children for "non-None" nodes).
+    Get all expanded legal Moves from this node.
     @return ist of Moves
     """
     def expandedMoves(self):
-        return [child["move"] for child in self.children.values() if child["node"] != None]
+        return [moveFromCode(moveKey) for moveKey in self.children]
 
 
     """
     True if this node is fully expanded. 
     AKA have you visited each child?
-    (search children for "None" nodes -> true if none found).
+    (= there are no untried moves left).
     """
     def isFullyExpanded(self):
-        for child in self.children.values():
-            if child["node"] == None: return False
-        return True
+        return not self.untriedMoves
 
         
     """
@@ -429,7 +739,7 @@ class MonteCarloNode:
     - NOT INCLUSIVE of termination due to winning.
     """
     def isLeaf(self):
-        return len(self.children) == 0
+        return not self.children and not self.untriedMoves
 
       
     """
@@ -439,7 +749,44 @@ class MonteCarloNode:
     exploration of new nodes/moves with exploitation of promising ones.
     
     @param {double} biasParam - The square of the bias parameter in the UCB1 algorithm, defaults to 2.
+    @param parentMoves - n_moves of the parent it's being selected from (a node can have more than one parent)
     @return {double} The UCB1 value of this node.
     """    
-    def getUCB1(self, biasParam):
-        return (self.n_wins / self.n_moves) + math.sqrt(biasParam) * math.log(self.parent.n_moves / self.n_moves)
+    def getUCB1(self, biasParam, parentMoves):
+        return (self.n_wins / self.n_moves) + math.sqrt(biasParam) * math.log(parentMoves / self.n_moves)
+
+
+
+"""
+returns a list of all the nodes in a subtree (the given node and everything expanded under it),
+each one once (nodes can be linked from more than one parent, and positions can repeat)
+"""
+def subtreeNodes(node):
+    nodes = []
+    seen = {node}
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        for childNode in node.children.values():
+            if childNode not in seen:
+                seen.add(childNode)
+                stack.append(childNode)
+    return nodes
+
+
+"""
+returns the nodes of a path (see MonteCarlo.select) in order, without repeats
+"""
+def uniqueNodes(path):
+    return list(dict.fromkeys(path))
+
+
+"""
+returns the rough memory use of a node, in bytes (see NODE_BYTES)
+"""
+def nodeBytes(node):
+    numMoves = len(node.children) + len(node.untriedMoves)
+    if node.boardState == None:
+        return LEAN_NODE_BYTES + CHILD_BYTES * numMoves
+    return NODE_BYTES + CHILD_BYTES * numMoves